@@ -1,105 +1,130 @@
-from fastapi import FastAPI, UploadFile, File
-from transformers import AutoProcessor, LlavaForConditionalGeneration
-from PIL import Image
-import torch
 import json
-import io
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Response, UploadFile, File
+from fastapi.responses import StreamingResponse
 
+from hf_inference import (
+    decode_image,
+    is_ready,
+    shutdown_decoder,
+    worker,
+    ModelNotReady,
+    QueueFull,
+    HF_LOAD_ON_STARTUP,
+    HF_RETRY_AFTER_SECONDS,
+    GENERATION_STATS,
+    PREFIX_CACHE_STATS,
+    STARTUP_REPORT,
+)
+from parsing import extract_json
 
-app = FastAPI()
 
-model_id = "llava-hf/llava-1.5-7b-hf"
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The port binds right away; the model loads on the worker thread
+    if HF_LOAD_ON_STARTUP:
+        worker.start()
+    yield
+    worker.stop()
+    shutdown_decoder()
 
-processor = AutoProcessor.from_pretrained(model_id)
 
-model = LlavaForConditionalGeneration.from_pretrained(
-    model_id,
-    dtype=torch.float16,   # 🔥 use dtype instead of torch_dtype
-    device_map="auto"
-)
-prompt = """
-        You are an expert dermatologist. Analyze these facial images VERY CAREFULLY and detect ALL visible skin conditions.
-    
-        **CRITICAL INSTRUCTIONS:**
-        1. Look at EVERY visible area of the skin - forehead, cheeks, nose, chin, temples, jaw.
-        2. Detect EVERYTHING visible - even minor issues count.
-        3. Do NOT skip or miss any visible skin problems.
-        4. Provide accurate bounding boxes for EVERY condition you detect.
-        
-        **Conditions to look for (be thorough):**
-        - Acne, pustules, comedones, whiteheads, blackheads, pimples
-        - Redness, inflammation, irritation, rosacea
-        - Wrinkles, fine lines, crow's feet, forehead lines
-        - Dark circles, under-eye bags, puffiness
-        - Dark spots, hyperpigmentation, sun spots, melasma
-        - Texture issues, rough patches, bumps, enlarged pores
-        - Dryness, flakiness, dehydration, dry patches
-        - Oiliness, shine, sebum buildup
-        - Scarring, post-acne marks, depressed scars
-        - Uneven skin tone, patches of different color
-        - Other visible conditions (BUT EXCLUDE normal facial hair)
-    
-        **EXCLUSIONS (Do NOT report these as conditions):**
-        - Normal facial hair, beard, mustache, stubble.
-        - Do NOT tag "Facial Hair" or "Stubble" as a skin condition unless it is specifically folliculitis or ingrown hairs.
-        
-        **For EACH condition you find:**
-        1. Create a descriptive name (e.g., "Acne Pustules", "Deep Forehead Wrinkles", "Dark Spots on Cheeks")
-        2. Rate confidence 0-100 (how sure are you)
-        3. Specify exact location (Forehead, Left Cheek, Right Cheek, Nose, Chin, Under Eyes, Temple, Jaw, etc.)
-        4. MANDATORY: A very short, one-sentence description of the problem.
-        5. MANDATORY: Draw a bounding box around EVERY visible instance using normalized coordinates (0.0-1.0)
-        - x1, y1 = top-left corner
-        - x2, y2 = bottom-right corner
-        - Example: if acne is on left cheek, draw box around that area
-        
-        **Grouping Strategy:**
-        - Group similar conditions into categories (e.g., "Acne & Blemishes", "Signs of Aging", "Pigmentation Issues", "Texture & Pores")
-        - Create new categories as needed based on what you see
-        
-        Provide output in JSON format. Do NOT return empty arrays for boundingBoxes - every condition MUST have visible boxes.
-
-        Analyze ALL visible skin conditions carefully.
-        """
+app = FastAPI(lifespan=lifespan)
+
+
+def busy(error):
+    detail = "Model is still loading" if isinstance(error, ModelNotReady) else "Inference queue is full, try again shortly"
+    return HTTPException(
+        status_code=503,
+        detail=detail,
+        headers={"Retry-After": str(HF_RETRY_AFTER_SECONDS)},
+    )
+
+
+async def read_image(file: UploadFile):
+    image_bytes = await file.read()
+    try:
+        return await decode_image(image_bytes)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Could not decode image")
+
 
 @app.post("/analyze")
 async def analyze_image(file: UploadFile = File(...)):
-    image_bytes = await file.read()
-    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-
-    conversation = [
-        {
-            "role": "user",
-            "content": [
-                {"type": "image"},
-                {"type": "text", "text": prompt},
-            ],
-        },
-    ]
-
-    text_prompt = processor.apply_chat_template(
-        conversation,
-        add_generation_prompt=True
-    )
+    image = await read_image(file)
+
+    # Generation runs on the inference worker; concurrent requests share one padded generate call
+    try:
+        response = await worker.submit(image)
+    except (ModelNotReady, QueueFull) as e:
+        raise busy(e)
 
-    inputs = processor(
-        images=image,
-        text=text_prompt,
-        return_tensors="pt"
-    ).to(model.device)
+    json_data = extract_json(response, "llava")
+    if json_data is None:
+        return {"error": "Invalid JSON output", "raw": response}
+    return json_data
 
-    with torch.no_grad():
-        output = model.generate(
-            **inputs,
-            max_new_tokens=1024,
-            temperature=0.2
-        )
 
-    response = processor.decode(output[0], skip_special_tokens=True)
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
+
+async def stream_tokens(streamer, result):
+    """SSE body: 'token' events with text as it is generated, then one
+    'result' event with the parsed JSON (or 'error' with the raw text)."""
     try:
-        json_start = response.find("{")
-        json_data = json.loads(response[json_start:])
-        return json_data
+        async for text in streamer:
+            if text:
+                yield format_sse("token", {"text": text})
+        response = await result
     except Exception as e:
-        return {"error": f"Invalid JSON output: {e}", "raw": response}
\ No newline at end of file
+        yield format_sse("error", {"error": str(e)})
+        return
+    finally:
+        result.cancel()  # client went away: stop generating for it
+
+    json_data = extract_json(response, "llava")
+    if json_data is None:
+        yield format_sse("error", {"error": "Invalid JSON output", "raw": response})
+    else:
+        yield format_sse("result", json_data)
+
+
+@app.post("/analyze/stream")
+async def analyze_image_stream(file: UploadFile = File(...)):
+    image = await read_image(file)
+    try:
+        streamer, result = worker.submit_stream(image)
+    except (ModelNotReady, QueueFull) as e:
+        raise busy(e)
+
+    return StreamingResponse(
+        stream_tokens(streamer, result),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Liveness: the process is up and serving, whether or not the model is loaded
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+# Readiness: only route traffic here once the model can answer
+@app.get("/ready")
+async def ready(response: Response):
+    if not is_ready():
+        response.status_code = 503
+    return STARTUP_REPORT
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "startup": STARTUP_REPORT,
+        "inference": worker.snapshot(),
+        "prefix_cache": PREFIX_CACHE_STATS,
+        "generation": GENERATION_STATS,
+    }
+
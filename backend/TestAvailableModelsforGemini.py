@@ -1,22 +1,20 @@
-import google.generativeai as genai
-import os
-from dotenv import load_dotenv
+# Lists Gemini models through the shared model catalog (see catalog.py)
 from tabulate import tabulate
 
-load_dotenv()
+from catalog import list_models
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
-models = genai.list_models()
+catalog = list_models("gemini")
 
 table_data = []
 
-for model in models:
+for model in catalog.models("gemini"):
     table_data.append([
-        model.name,
-        model.supported_generation_methods
+        model["id"],
+        model["context_window"],
+        model["max_output_tokens"],
+        "yes" if model["vision"] else "",
     ])
 
 print(tabulate(table_data,
-            headers=["Model Name", "Supported Methods"],
-            tablefmt="grid"))
\ No newline at end of file
+            headers=["Model Name", "Input Tokens", "Output Tokens", "Vision"],
+            tablefmt="grid"))
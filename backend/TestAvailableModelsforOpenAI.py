@@ -1,22 +1,18 @@
-from openai import OpenAI
-import os
-from dotenv import load_dotenv
+# Lists OpenAI models through the shared model catalog (see catalog.py)
 from tabulate import tabulate
 
-load_dotenv()
+from catalog import list_models
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-response = client.models.list()
+catalog = list_models("openai")
 
 table_data = []
 
-for model in response.data:
+for model in catalog.models("openai"):
     table_data.append([
-        model.id,
-        model.owned_by
+        model["id"],
+        model["owned_by"]
     ])
 
 print(tabulate(table_data,
             headers=["Model ID", "Owned By"],
-            tablefmt="grid"))
\ No newline at end of file
+            tablefmt="grid"))
@@ -1,58 +1,26 @@
-import requests
-import os
-from dotenv import load_dotenv
+# Lists free OpenRouter models through the shared model catalog (see catalog.py)
 from tabulate import tabulate
 
-load_dotenv()
+from catalog import list_models
 
-api_key = os.getenv("OPENROUTER_API_KEY")
+catalog = list_models("openrouter")
 
-url = "https://openrouter.ai/api/v1/models"
-
-headers = {
-    "Authorization": f"Bearer {api_key}",
-    "Content-Type": "application/json"
-}
-
-response = requests.get(url, headers=headers)
-
-if response.status_code != 200:
-    print("Error:", response.text)
+error = catalog.snapshot()["openrouter"]["error"]
+if error:
+    print("Error:", error)
     exit()
 
-models = response.json().get("data", [])
-
-# table_data = []
-
-# for model in models:
-#     table_data.append([
-#         model.get("id"),
-#         model.get("context_length"),
-#         model.get("pricing", {}).get("prompt"),
-#     ])
-
-# print(tabulate(table_data,
-#             headers=["Model ID", "Context Length", "Prompt Price"],
-#             tablefmt="grid"))
-
-
-# New Version with free models highlighted
 table_data = []
 
-for model in models:
-    pricing = model.get("pricing", {})
-    prompt_price = pricing.get("prompt")
-
-    try:
-        if float(prompt_price) == 0:
-            table_data.append([
-                model.get("id"),
-                model.get("context_length"),
-                prompt_price,
-            ])
-    except (TypeError, ValueError):
-        continue
+for model in catalog.models("openrouter"):
+    if model["prompt_price"] == 0:
+        table_data.append([
+            model["id"],
+            model["context_window"],
+            model["prompt_price"],
+            "yes" if model["vision"] else "",
+        ])
 
 print(tabulate(table_data,
-            headers=["Model ID", "Context Length", "Prompt Price"],
-            tablefmt="grid"))
\ No newline at end of file
+            headers=["Model ID", "Context Length", "Prompt Price", "Vision"],
+            tablefmt="grid"))
@@ -1,23 +1,127 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List
-import google.generativeai as genai
-import requests
-import os
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
 import json
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from typing import List, Optional
+from starlette.datastructures import UploadFile
+from starlette.exceptions import HTTPException as StarletteHTTPException
 from dotenv import load_dotenv
 
-load_dotenv()  # Load environment variables from .env file
+load_dotenv()  # Load .env before the modules below read their settings
+
+from cache import analysis_cache, analysis_flights, make_cache_key
+from catalog import model_catalog
+from dispatch import dispatch, chain_model_id, get_provider_chain, DISPATCH_MODE, PROVIDER_CHAIN
+from image_payload import parse_images, ImagePayload, InvalidImage
+from imaging import (
+    dedupe_images,
+    expand_image_ids,
+    normalize_images,
+    shutdown_executor as shutdown_image_executor,
+    IMAGE_NORMALIZE,
+)
+from keypool import key_pool_snapshot
+from metrics import (
+    log_event,
+    new_request_id,
+    record_stage,
+    render_metrics,
+    since_request_start,
+    span,
+    CACHE_RESULTS,
+    COALESCED_REQUESTS,
+    HTTP_REQUEST_SECONDS,
+    IMAGE_BYTES_SAVED,
+    IMAGES_DEDUPLICATED,
+    PAYLOAD_BYTES,
+    REQUEST_ID,
+    REQUEST_STAGES,
+    REQUEST_STARTED,
+)
+from parsing import parse_stats_snapshot
+from prompt_cache import gemini_context_cache
+from prompts import get_prompt
+from providers import close_http_client, PROVIDER_MODELS
+from ratelimit import budget_snapshot
+from registry import registry_snapshot, shutdown_providers, start_providers
+from router import provider_router
+from streaming import stream_provider_chain
+
+# Cold-start timings, served at /api/startup; provider SDKs are imported
+# on first use and show up under providers[*].import_seconds
+STARTUP_REPORT = {"phases": {"import": round(time.perf_counter() - _import_started, 3)}}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    # Model listings refresh in the background; requests only read the snapshot
+    catalog_task = asyncio.create_task(model_catalog.run(PROVIDER_CHAIN))
+    # The local model (hf) starts loading now, in the background; the port binds right away
+    providers_task = asyncio.create_task(start_providers(PROVIDER_CHAIN))
+    STARTUP_REPORT["phases"]["lifespan"] = round(time.perf_counter() - started, 3)
+    log_event("startup", chain=PROVIDER_CHAIN, dispatch_mode=DISPATCH_MODE, phases=STARTUP_REPORT["phases"])
+    yield
+    catalog_task.cancel()
+    providers_task.cancel()
+    await shutdown_providers()
+    await close_http_client()
+    shutdown_image_executor()
+    analysis_cache.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
 
-# Load API Keys
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# -----------------------------
+# Request Id, Timing And Logs
+# -----------------------------
+@app.middleware("http")
+async def observe_request(request: Request, call_next):
+    """Give every request an id (X-Request-ID, echoed back), collect its
+    stage timings and emit one structured log line when it completes."""
+    request_id = new_request_id(request.headers.get("x-request-id"))
+    REQUEST_ID.set(request_id)
+    REQUEST_STARTED.set(time.perf_counter())
+    stages = {}
+    REQUEST_STAGES.set(stages)
+
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        elapsed = since_request_start()
+        # Label by route template so unknown URLs cannot blow up the series count
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(elapsed, path=route.path if route else "unmatched", status=status)
+        log_event(
+            "request",
+            method=request.method,
+            path=request.url.path,
+            status=status,
+            duration_ms=round(elapsed * 1000, 1),
+            stages=stages,
+        )
+
+# Multipart upload limits
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", str(10 * 1024 * 1024)))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(40 * 1024 * 1024)))
+MAX_UPLOAD_FILES = int(os.getenv("MAX_UPLOAD_FILES", "10"))
+UPLOAD_CHUNK_BYTES = 256 * 1024
 
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
+# Batch analysis
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "500"))
 
 
 # -----------------------------
@@ -27,213 +131,421 @@ class AnalyzeRequest(BaseModel):
     images: List[str]
 
 
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    images: List[str]
+
+
+class BatchAnalyzeRequest(BaseModel):
+    items: List[BatchItem]
+    concurrency: Optional[int] = None
+
+
 # -----------------------------
-# Convert Base64 for Gemini
+# Prompt
 # -----------------------------
-def base64_to_gemini_part(base64_string: str):
-    header, encoded = base64_string.split(",", 1)
-    mime_type = header.split(";")[0].split(":")[1]
-
-    return {
-        "inline_data": {
-            "mime_type": mime_type,
-            "data": encoded
-        }
-    }
+SKIN_ANALYSIS_PROMPT = get_prompt("skin-analysis")
 
 
 # -----------------------------
-# Convert Base64 for OpenAI-style APIs
+# Analysis Pipeline
 # -----------------------------
-def base64_to_openai_image(base64_string: str):
-    return {
-        "type": "input_image",
-        "image_base64": base64_string.split(",")[1]
-    }
+def load_images(images):
+    """Decode and validate each base64 image once, up front, so a bad
+    upload is a 400 here rather than a 500 after a provider round trip.
+
+    The request's strings are released afterwards; from here on only the
+    ImagePayloads (raw bytes + one base64 body) are held.
+    """
+    try:
+        # Other formats Pillow can open are fine when they will be re-encoded
+        payloads = parse_images(images, convertible=IMAGE_NORMALIZE)
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    images.clear()
+    return payloads
+
+
+async def run_analysis(images, response: Response):
+    """Cache lookup -> image normalization -> provider chain, on
+    ImagePayloads. Shared by the JSON, multipart and batch endpoints so
+    they all return the same shape."""
+    PAYLOAD_BYTES.observe(sum(image.size for image in images))
+
+    # Identical photos + prompt + models -> reuse the previous analysis
+    with span("cache_lookup"):
+        cache_key = make_cache_key(images, SKIN_ANALYSIS_PROMPT.text, chain_model_id())
+        result = await analysis_cache.get(cache_key)
+    if result:
+        CACHE_RESULTS.inc(outcome="hit")
+        log_event("analysis_cached")
+        response.headers["X-Cache"] = "HIT"
+        return result
+    CACHE_RESULTS.inc(outcome="miss")
+    response.headers["X-Cache"] = "MISS"
+
+    async def analyze():
+        # Downscale / strip EXIF / re-encode before upload
+        with span("normalize"):
+            normalized, bytes_saved, hashes = await normalize_images(images)
+        IMAGE_BYTES_SAVED.inc(bytes_saved)
+
+        # Near-identical frames cost image tokens without adding coverage
+        with span("dedupe"):
+            unique, groups = dedupe_images(normalized, hashes)
+        removed = len(normalized) - len(unique)
+        IMAGES_DEDUPLICATED.inc(removed)
+
+        # Gemini -> OpenRouter (-> Groq), sequential, hedged or consensus per DISPATCH_MODE
+        with span("dispatch"):
+            result, provider = await dispatch(unique, SKIN_ANALYSIS_PROMPT)
+        if result:
+            result = expand_image_ids(result, groups)
+            with span("cache_store"):
+                await analysis_cache.set(cache_key, result)
+        return result, provider, bytes_saved, removed
+
+    # Identical requests already in flight wait for that call instead of
+    # spending another upstream request on the same answer
+    started = time.perf_counter()
+    (result, provider, bytes_saved, removed), coalesced = await analysis_flights.run(cache_key, analyze)
+    if coalesced:
+        record_stage("coalesced_wait", time.perf_counter() - started)
+        COALESCED_REQUESTS.inc()
+        response.headers["X-Coalesced"] = "true"
+    response.headers["X-Image-Bytes-Saved"] = str(bytes_saved)
+    response.headers["X-Images-Deduplicated"] = str(removed)
+
+    if result:
+        log_event("analysis_served", provider=provider, coalesced=coalesced)
+        response.headers["X-AI-Provider"] = provider
+        return result
+
+    log_event("analysis_failed", reason="all providers failed")
+
+    # If All Fail
+    raise HTTPException(
+        status_code=500,
+        detail="All AI providers failed"
+    )
 
 
 # -----------------------------
-# Gemini Call
+# API Route With Failover
 # -----------------------------
-def call_gemini(images, prompt):
+@app.post("/api/analyze-skin")
+async def analyze_skin(request: AnalyzeRequest, response: Response):
+    # Body read + JSON/pydantic validation happened before we got here
+    record_stage("payload", since_request_start())
     try:
-        print("Trying Gemini...")
-        image_parts = [base64_to_gemini_part(img) for img in images]
+        images = request.images
 
-        model = genai.GenerativeModel("gemini-2.5-flash")
+        if not images or not isinstance(images, list):
+            raise HTTPException(
+                status_code=400,
+                detail="Provide array of base64 images in 'images'"
+            )
 
-        response = model.generate_content(
-            contents=image_parts + [prompt],
-            generation_config={"response_mime_type": "application/json"}
-        )
+        return await run_analysis(load_images(images), response)
 
-        return json.loads(response.text.strip())
+    except HTTPException:
+        raise
     except Exception as e:
-        print("Gemini failed:", e)
-        return None
+        log_event("request_error", error=str(e))
+        raise HTTPException(
+            status_code=500,
+            detail=str(e)
+        )
 
 
 # -----------------------------
-# OpenRouter Call
+# Server-Sent Events Route
 # -----------------------------
-def call_openrouter(images, prompt):
-    try:
-        print("Trying OpenRouter...")
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-        url = "https://openrouter.ai/api/v1/chat/completions"
 
-        content = [{"type": "text", "text": prompt}]
-        content += [base64_to_openai_image(img) for img in images]
+async def stream_analysis_events(images):
+    """SSE body: one 'category' event per finished category, then a
+    'summary' event carrying the same result /api/analyze-skin returns.
+    Streaming always follows the failover chain, even in consensus mode."""
+    try:
+        PAYLOAD_BYTES.observe(sum(image.size for image in images))
+        cache_key = make_cache_key(images, SKIN_ANALYSIS_PROMPT.text, chain_model_id("stream"))
+        with span("cache_lookup"):
+            result = await analysis_cache.get(cache_key)
+        if result:
+            CACHE_RESULTS.inc(outcome="hit")
+            for category in result if isinstance(result, list) else []:
+                yield format_sse("category", category)
+            yield format_sse("summary", {"provider": "cache", "cache": "HIT", "result": result})
+            return
+        CACHE_RESULTS.inc(outcome="miss")
+
+        with span("normalize"):
+            images, bytes_saved, hashes = await normalize_images(images)
+        IMAGE_BYTES_SAVED.inc(bytes_saved)
+        with span("dedupe"):
+            unique, groups = dedupe_images(images, hashes)
+        IMAGES_DEDUPLICATED.inc(len(images) - len(unique))
+
+        async for event, data in stream_provider_chain(unique, SKIN_ANALYSIS_PROMPT):
+            if event == "result":
+                result = expand_image_ids(data["result"], groups)
+                await analysis_cache.set(cache_key, result)
+                log_event("analysis_served", provider=data["provider"], stream=True)
+                yield format_sse("summary", {
+                    **data,
+                    "result": result,
+                    "cache": "MISS",
+                    "image_bytes_saved": bytes_saved,
+                    "images_deduplicated": len(images) - len(unique),
+                })
+                return
+            if event == "category":
+                data = expand_image_ids(data, groups)
+            yield format_sse(event, data)
+
+        log_event("analysis_failed", reason="all providers failed", stream=True)
+        yield format_sse("error", {"detail": "All AI providers failed"})
+    except Exception as e:
+        log_event("request_error", error=str(e))
+        yield format_sse("error", {"detail": str(e)})
 
-        payload = {
-            "model": "qwen/qwen3-vl-30b-a3b-thinking",
-            # "model": "nvidia/nemotron-nano-12b-v2-vl:free",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": content
-                }
-            ]
-        }
 
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json"
-        }
+@app.post("/api/analyze-skin/stream")
+async def analyze_skin_stream(request: AnalyzeRequest):
+    images = request.images
 
-        response = requests.post(url, headers=headers, json=payload, timeout=60)
+    if not images or not isinstance(images, list):
+        raise HTTPException(
+            status_code=400,
+            detail="Provide array of base64 images in 'images'"
+        )
 
-        data = response.json()
-        text = data["choices"][0]["message"]["content"]
+    return StreamingResponse(
+        stream_analysis_events(load_images(images)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        return json.loads(text)
-    except Exception as e:
-        print("OpenRouter failed:", e)
-        return None
+
+# -----------------------------
+# Multipart Upload Helpers
+# -----------------------------
+def limit_request_body(request: Request, limit: int) -> Request:
+    """The same request, with a body that fails with a 413 once more than
+    limit bytes have arrived. Content-Length can be absent (chunked
+    uploads), and form parsing spools every part before we see it, so the
+    request budget has to be enforced while the body streams in."""
+    receive = request.receive
+    received = 0
+
+    async def limited_receive():
+        nonlocal received
+        message = await receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > limit:
+                raise HTTPException(
+                    status_code=413,
+                    detail="Request exceeds the upload size limit"
+                )
+        return message
+
+    return Request(request.scope, limited_receive)
+
+
+async def read_upload(upload: UploadFile, budget: int) -> bytes:
+    """Read a spooled upload in chunks, enforcing the per-file limit and
+    whatever is left of the per-request budget."""
+    limit = min(MAX_UPLOAD_FILE_BYTES, budget)
+    chunks = []
+    size = 0
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > limit:
+            raise HTTPException(
+                status_code=413,
+                detail=f"'{upload.filename}' exceeds the upload size limit"
+            )
+        chunks.append(chunk)
+    return b"".join(chunks)
 
 
 # -----------------------------
-# Groq Call
+# Multipart API Route
 # -----------------------------
-def call_groq(images, prompt):
+@app.post("/api/analyze-skin/upload")
+async def analyze_skin_upload(request: Request, response: Response):
+    """Same analysis as /api/analyze-skin, but images arrive as raw
+    multipart files (field name 'images') instead of base64 inside JSON.
+    Starlette spools each part to a temporary file, so large photos never
+    sit in memory as one JSON string; the body is cut off as soon as it
+    passes MAX_UPLOAD_REQUEST_BYTES."""
     try:
-        print("Trying Groq...")
-
-        url = "https://api.groq.com/openai/v1/chat/completions"
+        content_length = request.headers.get("content-length")
+        if content_length and int(content_length) > MAX_UPLOAD_REQUEST_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail="Request exceeds the upload size limit"
+            )
 
-        content = [{"type": "text", "text": prompt}]
-        content += [base64_to_openai_image(img) for img in images]
+        body = limit_request_body(request, MAX_UPLOAD_REQUEST_BYTES)
+        async with body.form(max_files=MAX_UPLOAD_FILES) as form:
+            uploads = [item for item in form.getlist("images") if isinstance(item, UploadFile)]
+            if not uploads:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Provide image files in the 'images' form field"
+                )
+
+            images = []
+            budget = MAX_UPLOAD_REQUEST_BYTES
+            for upload in uploads:
+                data = await read_upload(upload, budget)
+                budget -= len(data)
+                try:
+                    images.append(ImagePayload.from_bytes(data, convertible=IMAGE_NORMALIZE))
+                except InvalidImage as e:
+                    raise HTTPException(status_code=400, detail=f"'{upload.filename}': {e}")
+                del data
+
+        return await run_analysis(images, response)
+
+    # Starlette's own 400s from form parsing (too many files / fields,
+    # malformed multipart) are not FastAPI HTTPExceptions
+    except StarletteHTTPException:
+        raise
+    except Exception as e:
+        log_event("request_error", error=str(e))
+        raise HTTPException(
+            status_code=500,
+            detail=str(e)
+        )
 
-        payload = {
-            "model": "llama-3.2-11b-vision-preview",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": content
-                }
-            ]
-        }
 
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
+# -----------------------------
+# Batch API Route
+# -----------------------------
+async def analyze_batch_item(index, item: BatchItem, semaphore):
+    async with semaphore:
+        started = time.perf_counter()
+        outcome = {"index": index, "id": item.id}
+        item_response = Response()
+        try:
+            if not item.images:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Provide array of base64 images in 'images'"
+                )
+            result = await run_analysis(load_images(item.images), item_response)
+            outcome.update({
+                "status": "ok",
+                "provider": item_response.headers.get("X-AI-Provider"),
+                "cache": item_response.headers.get("X-Cache"),
+                "result": result,
+            })
+        except HTTPException as e:
+            outcome.update({"status": "error", "status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            log_event("batch_item_failed", index=index, error=str(e))
+            outcome.update({"status": "error", "status_code": 500, "detail": str(e)})
+        outcome["seconds"] = round(time.perf_counter() - started, 3)
+        return outcome
+
+
+async def stream_batch(items, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [
+        asyncio.create_task(analyze_batch_item(index, item, semaphore))
+        for index, item in enumerate(items)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield json.dumps(await next_done) + "\n"
+    finally:
+        # Client went away: stop the rest of the batch
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/api/analyze-skin/batch")
+async def analyze_skin_batch(request: BatchAnalyzeRequest):
+    """Analyze many independent image sets. Items run with bounded
+    concurrency under the per-provider request budgets and are streamed
+    back as NDJSON lines in completion order, each with its own status."""
+    if not request.items:
+        raise HTTPException(
+            status_code=400,
+            detail="Provide at least one item in 'items'"
+        )
+    if len(request.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"A batch may contain at most {MAX_BATCH_ITEMS} items"
+        )
 
-        response = requests.post(url, headers=headers, json=payload, timeout=60)
+    concurrency = max(1, min(request.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY))
+    return StreamingResponse(
+        stream_batch(request.items, concurrency),
+        media_type="application/x-ndjson",
+    )
 
-        data = response.json()
-        text = data["choices"][0]["message"]["content"]
 
-        return json.loads(text)
-    except Exception as e:
-        print("Groq failed:", e)
-        return None
+# -----------------------------
+# Metrics
+# -----------------------------
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 # -----------------------------
-# API Route With Failover
+# Cache Stats
 # -----------------------------
-@app.post("/api/analyze-skin")
-async def analyze_skin(request: AnalyzeRequest):
-    try:
-        images = request.images
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return {**analysis_cache.snapshot(), "coalescing": analysis_flights.snapshot()}
 
-        if not images or not isinstance(images, list):
-            raise HTTPException(
-                status_code=400,
-                detail="Provide array of base64 images in 'images'"
-            )
 
-        prompt = """
-        You are an expert dermatologist. Analyze these facial images VERY CAREFULLY and detect ALL visible skin conditions.
-    
-        **CRITICAL INSTRUCTIONS:**
-        1. Look at EVERY visible area of the skin - forehead, cheeks, nose, chin, temples, jaw.
-        2. Detect EVERYTHING visible - even minor issues count.
-        3. Do NOT skip or miss any visible skin problems.
-        4. Provide accurate bounding boxes for EVERY condition you detect.
-        
-        **Conditions to look for (be thorough):**
-        - Acne, pustules, comedones, whiteheads, blackheads, pimples
-        - Redness, inflammation, irritation, rosacea
-        - Wrinkles, fine lines, crow's feet, forehead lines
-        - Dark circles, under-eye bags, puffiness
-        - Dark spots, hyperpigmentation, sun spots, melasma
-        - Texture issues, rough patches, bumps, enlarged pores
-        - Dryness, flakiness, dehydration, dry patches
-        - Oiliness, shine, sebum buildup
-        - Scarring, post-acne marks, depressed scars
-        - Uneven skin tone, patches of different color
-        - Other visible conditions (BUT EXCLUDE normal facial hair)
-    
-        **EXCLUSIONS (Do NOT report these as conditions):**
-        - Normal facial hair, beard, mustache, stubble.
-        - Do NOT tag "Facial Hair" or "Stubble" as a skin condition unless it is specifically folliculitis or ingrown hairs.
-        
-        **For EACH condition you find:**
-        1. Create a descriptive name (e.g., "Acne Pustules", "Deep Forehead Wrinkles", "Dark Spots on Cheeks")
-        2. Rate confidence 0-100 (how sure are you)
-        3. Specify exact location (Forehead, Left Cheek, Right Cheek, Nose, Chin, Under Eyes, Temple, Jaw, etc.)
-        4. MANDATORY: A very short, one-sentence description of the problem.
-        5. MANDATORY: Draw a bounding box around EVERY visible instance using normalized coordinates (0.0-1.0)
-        - x1, y1 = top-left corner
-        - x2, y2 = bottom-right corner
-        - Example: if acne is on left cheek, draw box around that area
-        
-        **Grouping Strategy:**
-        - Group similar conditions into categories (e.g., "Acne & Blemishes", "Signs of Aging", "Pigmentation Issues", "Texture & Pores")
-        - Create new categories as needed based on what you see
-        
-        Provide output in JSON format. Do NOT return empty arrays for boundingBoxes - every condition MUST have visible boxes.
-        """
-
-        # 1️⃣ Gemini
-        result = call_gemini(images, prompt)
-        if result:
-            print("Success from Gemini")
-            return result
+# -----------------------------
+# Provider Routing State
+# -----------------------------
+@app.get("/api/providers")
+async def provider_state():
+    return {
+        "configured_chain": PROVIDER_CHAIN,
+        "current_order": [name for name, _ in get_provider_chain()],
+        "providers": provider_router.snapshot(),
+        "budgets": budget_snapshot(),
+        "keys": key_pool_snapshot(),
+        "parsing": parse_stats_snapshot(),
+        "prompt": {"id": SKIN_ANALYSIS_PROMPT.id, "fingerprint": SKIN_ANALYSIS_PROMPT.fingerprint},
+        "prompt_cache": gemini_context_cache.snapshot(),
+    }
 
-        # 2️⃣ OpenRouter
-        result = call_openrouter(images, prompt)
-        if result:
-            print("Success from OpenRouter")
-            return result
 
-        # # 3️⃣ Groq
-        # result = call_groq(images, prompt)
-        # if result:
-        #     print("Success from Groq")
-        #     return result
+@app.get("/api/startup")
+async def startup_state():
+    return {
+        **STARTUP_REPORT,
+        "chain": PROVIDER_CHAIN,
+        "dispatch_mode": DISPATCH_MODE,
+        "providers": registry_snapshot(PROVIDER_CHAIN),
+    }
 
-        # 4️⃣ If All Fail
-        raise HTTPException(
-            status_code=500,
-            detail="All AI providers failed"
-        )
 
-    except Exception as e:
-        print("Final Error:", e)
-        raise HTTPException(
-            status_code=500,
-            detail=str(e)
-        )
\ No newline at end of file
+@app.get("/api/models")
+async def model_state(provider: Optional[str] = None, vision: bool = False):
+    models = model_catalog.models(provider)
+    if vision:
+        models = [model for model in models if model["vision"]]
+    return {
+        "selected": PROVIDER_MODELS,
+        "catalog": model_catalog.snapshot(),
+        "models": models,
+    }
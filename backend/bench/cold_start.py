@@ -0,0 +1,153 @@
+"""Cold-start report for app.py: import time and time to first response.
+
+Runs `python -X importtime -c "import app"` a few times to get the import
+cost (the total plus the modules app imports directly), then starts the
+app under uvicorn and times how long it takes to answer. The provider
+chain comes from the environment as usual, so the local model's torch
+import only happens when "hf" is in PROVIDER_CHAIN, and then in the
+background after the port binds, so it doesn't count here.
+
+Results are written as JSON tagged with the current commit. Pass an
+earlier file to --compare to flag regressions, as with bench.load_test.
+
+    cd backend
+    python -m bench.cold_start --runs 5 --out cold-start.json
+    python -m bench.cold_start --compare cold-start.json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+from bench.load_test import (
+    current_commit,
+    start_server,
+    stop_server,
+    wait_until_up,
+    BACKEND_DIR,
+    REGRESSION_THRESHOLD,
+)
+
+
+# -----------------------------
+# Import Time
+# -----------------------------
+def parse_importtime(stderr):
+    """-X importtime output -> (total microseconds for app, {module app
+    imports directly: cumulative microseconds})."""
+    children = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        # One space, then two per nesting level; children print before their parent
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth == 1:
+            children[name] = int(cumulative)
+        elif depth == 0:
+            if name == "app":
+                return int(cumulative), children
+            children = {}
+    return None, {}
+
+
+def measure_import():
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        sys.exit(f"import app failed:\n{completed.stderr[-2000:]}")
+    return parse_importtime(completed.stderr)
+
+
+# -----------------------------
+# Time To First Response
+# -----------------------------
+async def measure_ready(port):
+    url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = start_server("app:app", port)
+    try:
+        await wait_until_up(f"{url}/api/startup")
+        ready = time.perf_counter() - started
+        async with httpx.AsyncClient() as client:
+            report = (await client.get(f"{url}/api/startup")).json()
+    finally:
+        stop_server(process)
+    return ready, report
+
+
+# -----------------------------
+# Reporting
+# -----------------------------
+def compare(result, before):
+    lines = []
+    for key in ("import_ms", "ready_ms"):
+        if not before or not before.get(key):
+            continue
+        change = result[key] / before[key] - 1
+        flag = "REGRESSED " if change > REGRESSION_THRESHOLD else ""
+        lines.append(f"{flag}{key} {before[key]} -> {result[key]} ({change:+.0%})")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="imports and server starts to take the median of")
+    parser.add_argument("--top", type=int, default=10, help="heaviest packages to list")
+    parser.add_argument("--port", type=int, default=8902)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="results JSON from an earlier run")
+    args = parser.parse_args()
+
+    from tabulate import tabulate
+
+    imports = [measure_import() for _ in range(args.runs)]
+    readies = []
+    for _ in range(args.runs):
+        ready, report = asyncio.run(measure_ready(args.port))
+        readies.append(ready)
+
+    packages = defaultdict(list)
+    for _, per_package in imports:
+        for name, micros in per_package.items():
+            packages[name].append(micros)
+    heaviest = sorted(((name, statistics.median(values) / 1000) for name, values in packages.items()),
+                      key=lambda item: -item[1])[:args.top]
+
+    result = {
+        "commit": current_commit(),
+        "chain": report.get("chain"),
+        "runs": args.runs,
+        "import_ms": round(statistics.median(total for total, _ in imports) / 1000),
+        "ready_ms": round(statistics.median(readies) * 1000),
+        "app_phases": report.get("phases"),
+        "packages_ms": {name: round(ms, 1) for name, ms in heaviest},
+    }
+
+    print(f"Chain: {','.join(result['chain'] or [])}")
+    print(f"import app: {result['import_ms']} ms, first response: {result['ready_ms']} ms (median of {args.runs})")
+    print(tabulate(heaviest, headers=["Package", "Import ms"], tablefmt="grid", floatfmt=".1f"))
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        print(f"vs {baseline.get('commit') or 'baseline'}:")
+        for line in compare(result, baseline) or ["n/a"]:
+            print(f"  {line}")
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(result, indent=2))
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
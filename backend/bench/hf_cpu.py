@@ -0,0 +1,154 @@
+"""Compare the local model's inference modes on a fixed set of images.
+
+Each mode runs in its own process, so load time and peak RSS are measured
+cleanly. Reports mean/p50/max latency per image, peak RSS, the share of
+outputs that parse as JSON, and how well each mode's condition names agree
+with the reference mode (mean Jaccard overlap per image).
+
+    cd backend
+    python -m bench.hf_cpu --images ./sample_images --modes gpu,cpu,cpu-int8
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def image_paths(directory):
+    return sorted(path for path in Path(directory).iterdir() if path.suffix.lower() in IMAGE_SUFFIXES)
+
+
+def condition_names(result):
+    """Lower-cased condition names from a parsed SkinConditionCategory[]."""
+    names = set()
+    if isinstance(result, dict):
+        result = [result]
+    for category in result or []:
+        if not isinstance(category, dict):
+            continue
+        for condition in category.get("conditions") or []:
+            if isinstance(condition, dict) and condition.get("name"):
+                names.add(str(condition["name"]).strip().lower())
+    return names
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+# -----------------------------
+# One Mode (child process)
+# -----------------------------
+def run_mode(mode, images_dir, out_path):
+    os.environ["HF_INFERENCE_MODE"] = mode
+
+    from PIL import Image
+
+    import hf_inference
+    from parsing import extract_json
+
+    hf_inference.load_model()
+
+    results = []
+    for path in image_paths(images_dir):
+        with Image.open(path) as image:
+            image = image.convert("RGB")
+        started = time.perf_counter()
+        text = hf_inference.generate_batch([image])[0]
+        elapsed = time.perf_counter() - started
+        parsed = extract_json(text, mode)
+        results.append({
+            "image": path.name,
+            "seconds": elapsed,
+            "valid_json": parsed is not None,
+            "conditions": sorted(condition_names(parsed)),
+        })
+
+    Path(out_path).write_text(json.dumps({
+        "mode": mode,
+        "startup": hf_inference.STARTUP_REPORT,
+        "peak_rss_mb": peak_rss_mb(),
+        "results": results,
+    }))
+
+
+# -----------------------------
+# Comparison (parent process)
+# -----------------------------
+def summarize(report, reference):
+    seconds = [item["seconds"] for item in report["results"]]
+    reference_names = {item["image"]: set(item["conditions"]) for item in reference["results"]}
+    overlaps = [
+        jaccard(set(item["conditions"]), reference_names.get(item["image"], set()))
+        for item in report["results"]
+    ]
+    return [
+        report["mode"],
+        report["startup"]["phases"].get("total"),
+        round(statistics.mean(seconds), 2) if seconds else None,
+        round(statistics.median(seconds), 2) if seconds else None,
+        round(max(seconds), 2) if seconds else None,
+        report["peak_rss_mb"],
+        f"{sum(item['valid_json'] for item in report['results'])}/{len(seconds)}",
+        round(statistics.mean(overlaps), 2) if overlaps else None,
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", required=True, help="directory of test images")
+    parser.add_argument("--modes", default="gpu,cpu-int8", help="comma-separated modes; the first is the reference")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_mode(args.worker, args.images, args.out)
+        return
+
+    if not image_paths(args.images):
+        sys.exit(f"No images found in {args.images}")
+
+    reports = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in [mode.strip() for mode in args.modes.split(",") if mode.strip()]:
+            out_path = Path(tmp) / f"{mode}.json"
+            print(f"Running {mode}...")
+            completed = subprocess.run(
+                [sys.executable, "-m", "bench.hf_cpu", "--images", args.images, "--worker", mode, "--out", str(out_path)]
+            )
+            if completed.returncode != 0:
+                print(f"{mode} failed (exit {completed.returncode})")
+                continue
+            reports.append(json.loads(out_path.read_text()))
+
+    if not reports:
+        sys.exit("Every mode failed")
+
+    from tabulate import tabulate
+
+    table_data = [summarize(report, reports[0]) for report in reports]
+    print(tabulate(table_data,
+                headers=["Mode", "Load s", "Mean s", "p50 s", "Max s", "Peak RSS MB", "Valid JSON",
+                         f"Overlap vs {reports[0]['mode']}"],
+                tablefmt="grid"))
+
+
+if __name__ == "__main__":
+    main()
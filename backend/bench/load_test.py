@@ -0,0 +1,302 @@
+"""Offline load test for app.py against the mock providers.
+
+Starts bench.mock_providers once, then for every scenario starts a fresh
+app.py (so breaker, key and budget state never leak between scenarios)
+pointed at the mock via GEMINI_BASE_URL / OPENROUTER_BASE_URL /
+GROQ_BASE_URL, drives POST /api/analyze-skin at a fixed concurrency and
+reports throughput and p50/p95/p99 latency per scenario.
+
+Results are written as JSON tagged with the current commit; pass an
+earlier file to --compare to flag regressions.
+
+    cd backend
+    python -m bench.load_test --requests 200 --concurrency 16 --out bench-results.json
+    python -m bench.load_test --compare bench-results.json
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Provider profiles sent to the mock (see mock_providers.DEFAULT_PROFILE)
+# plus app settings for the scenario
+SCENARIOS = {
+    "healthy": {
+        "providers": {},
+        "env": {},
+    },
+    "gemini-slow": {
+        "providers": {"gemini": {"latency_ms": 4000, "latency_sigma": 0.6}},
+        "env": {},
+    },
+    "gemini-down": {
+        "providers": {"gemini": {"error_rate": 1.0}},
+        "env": {},
+    },
+    "gemini-rate-limited": {
+        "providers": {"gemini": {"rate_limit_rate": 0.5, "retry_after": 5}},
+        "env": {},
+    },
+    "malformed-output": {
+        "providers": {"gemini": {"malformed_rate": 0.3}, "openrouter": {"malformed_rate": 0.3}},
+        "env": {},
+    },
+    "hedged-slow-tail": {
+        "providers": {"gemini": {"latency_ms": 1500, "latency_sigma": 1.0}},
+        "env": {"DISPATCH_MODE": "hedged", "HEDGE_DELAY_SECONDS": "2"},
+    },
+    "consensus": {
+        "providers": {"openrouter": {"latency_ms": 1200}},
+        "env": {"DISPATCH_MODE": "consensus"},
+    },
+}
+
+# A scenario regresses when p95 grows or throughput drops by more than this
+REGRESSION_THRESHOLD = 0.10
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def sample_image(seed):
+    """A small JPEG data URI, different per request so the analysis cache
+    never answers for the upstream."""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    image = Image.new("RGB", (64, 64), tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=BACKEND_DIR, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# -----------------------------
+# Processes
+# -----------------------------
+def start_server(target, port, env=None, quiet=True):
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL if quiet else None,
+    )
+
+
+async def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def app_env(mock_url, scenario_env):
+    return {
+        "GEMINI_BASE_URL": f"{mock_url}/gemini",
+        "OPENROUTER_BASE_URL": f"{mock_url}/openrouter",
+        "GROQ_BASE_URL": f"{mock_url}/groq",
+        "GEMINI_API_KEY": "bench-gemini-key",
+        "GOOGLE_API_KEY": "",
+        "OPENROUTER_API_KEY": "bench-openrouter-key",
+        "GROQ_API_KEY": "bench-groq-key",
+        "OPENAI_API_KEY": "",
+        "PROVIDER_CHAIN": "gemini,openrouter,groq",
+        "ANALYSIS_CACHE_SIZE": "0",
+        "ANALYSIS_CACHE_DB": "",
+        "AUTO_SELECT_MODELS": "false",
+        **scenario_env,
+    }
+
+
+# -----------------------------
+# Load Generator
+# -----------------------------
+async def drive(app_url, requests, concurrency, timeout):
+    latencies = []
+    statuses = {}
+    providers = {}
+    next_index = 0
+
+    async def worker(client):
+        nonlocal next_index
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await client.post(f"{app_url}/api/analyze-skin", json={"images": [sample_image(index)]})
+                status = str(response.status_code)
+                provider = response.headers.get("x-ai-provider")
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+                provider = None
+            latency = time.perf_counter() - started
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == "200":
+                latencies.append(latency)
+                providers[provider] = providers.get(provider, 0) + 1
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=timeout, limits=httpx.Limits(max_connections=concurrency)) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "success_rate": round(len(latencies) / requests, 3),
+        "p50_ms": _ms(percentile(latencies, 0.50)),
+        "p95_ms": _ms(percentile(latencies, 0.95)),
+        "p99_ms": _ms(percentile(latencies, 0.99)),
+        "max_ms": _ms(max(latencies) if latencies else None),
+        "statuses": statuses,
+        "providers": providers,
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000)
+
+
+async def run_scenario(name, scenario, args, mock_url):
+    async with httpx.AsyncClient() as client:
+        await client.post(f"{mock_url}/_scenario", json={"providers": scenario["providers"], "seed": args.seed})
+
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    app_process = start_server("app:app", args.app_port, app_env(mock_url, scenario["env"]), quiet=not args.verbose)
+    try:
+        await wait_until_up(f"{app_url}/api/cache/stats")
+        result = await drive(app_url, args.requests, args.concurrency, args.timeout)
+    finally:
+        stop_server(app_process)
+
+    async with httpx.AsyncClient() as client:
+        result["upstream"] = (await client.get(f"{mock_url}/_stats")).json()
+    return result
+
+
+# -----------------------------
+# Reporting
+# -----------------------------
+def print_report(results, baseline=None):
+    from tabulate import tabulate
+
+    table_data = []
+    for name, result in results.items():
+        row = [
+            name,
+            result["throughput_rps"],
+            result["success_rate"],
+            result["p50_ms"],
+            result["p95_ms"],
+            result["p99_ms"],
+            ", ".join(f"{provider}:{count}" for provider, count in result["providers"].items()),
+        ]
+        if baseline is not None:
+            row.append(compare(result, baseline.get("scenarios", {}).get(name)))
+        table_data.append(row)
+
+    headers = ["Scenario", "Req/s", "Success", "p50 ms", "p95 ms", "p99 ms", "Served by"]
+    if baseline is not None:
+        headers.append(f"vs {baseline.get('commit') or 'baseline'}")
+    print(tabulate(table_data, headers=headers, tablefmt="grid"))
+
+
+def compare(result, before):
+    if not before or not before.get("p95_ms") or not before.get("throughput_rps"):
+        return "n/a"
+    p95_change = (result["p95_ms"] or 0) / before["p95_ms"] - 1
+    throughput_change = result["throughput_rps"] / before["throughput_rps"] - 1
+    flag = "REGRESSED " if p95_change > REGRESSION_THRESHOLD or throughput_change < -REGRESSION_THRESHOLD else ""
+    return f"{flag}p95 {p95_change:+.0%}, req/s {throughput_change:+.0%}"
+
+
+async def main_async(args):
+    names = [name.strip() for name in args.scenarios.split(",")] if args.scenarios else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(unknown)} (known: {', '.join(SCENARIOS)})")
+
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    mock_process = start_server("bench.mock_providers:app", args.mock_port)
+    results = {}
+    try:
+        await wait_until_up(f"{mock_url}/_stats")
+        for name in names:
+            print(f"Running {name}...")
+            results[name] = await run_scenario(name, SCENARIOS[name], args, mock_url)
+    finally:
+        stop_server(mock_process)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=120.0, help="client timeout per request (s)")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the mock's latency and failure draws")
+    parser.add_argument("--mock-port", type=int, default=8900)
+    parser.add_argument("--app-port", type=int, default=8901)
+    parser.add_argument("--verbose", action="store_true", help="show the app's own output")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="results JSON from an earlier run")
+    args = parser.parse_args()
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    results = asyncio.run(main_async(args))
+    print_report(results, baseline)
+
+    if args.out:
+        Path(args.out).write_text(json.dumps({
+            "commit": current_commit(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "scenarios": results,
+        }, indent=2))
+        print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Local stand-ins for the upstream APIs app.py talks to.
+
+Serves, under one port:
+
+    /gemini/models/{model}:generateContent
+    /gemini/models/{model}:streamGenerateContent?alt=sse
+    /gemini/cachedContents
+    /openrouter/chat/completions    (stream or not)
+    /groq/chat/completions          (stream or not)
+    /{provider}/models              (for the model catalog)
+
+Each provider behaves according to the active scenario profile: lognormal
+latency around latency_ms, and error_rate / rate_limit_rate /
+malformed_rate chances of a 500, a 429 with Retry-After, or unparseable
+output. POST /_scenario swaps the profiles; GET /_stats returns what was
+served. Point the app at it with GEMINI_BASE_URL, OPENROUTER_BASE_URL and
+GROQ_BASE_URL (see bench/load_test.py).
+
+    cd backend
+    uvicorn bench.mock_providers:app --port 8900
+"""
+import asyncio
+import json
+import math
+import random
+from collections import defaultdict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_PROFILE = {
+    "latency_ms": 800,       # median
+    "latency_sigma": 0.4,    # lognormal spread; 0 means constant latency
+    "error_rate": 0.0,
+    "rate_limit_rate": 0.0,
+    "malformed_rate": 0.0,
+    "retry_after": 2,
+    "stream_chunks": 8,
+}
+
+PROVIDERS = ("gemini", "openrouter", "groq")
+
+profiles = {name: dict(DEFAULT_PROFILE) for name in PROVIDERS}
+served = defaultdict(lambda: defaultdict(int))
+
+# A small answer in the SkinConditionCategory[] shape the frontend expects
+ANSWER = json.dumps([
+    {
+        "category": "Acne",
+        "conditions": [
+            {
+                "name": "Papules",
+                "confidence": 82,
+                "location": "Left cheek",
+                "description": "Small raised red bumps.",
+                "boundingBoxes": [{"imageId": 0, "box": {"x1": 0.2, "y1": 0.4, "x2": 0.3, "y2": 0.5}}],
+            }
+        ],
+    },
+    {
+        "category": "Pigmentation",
+        "conditions": [
+            {
+                "name": "Dark spots",
+                "confidence": 64,
+                "location": "Forehead",
+                "description": "Scattered hyperpigmented macules.",
+                "boundingBoxes": [{"imageId": 0, "box": {"x1": 0.4, "y1": 0.1, "x2": 0.6, "y2": 0.2}}],
+            }
+        ],
+    },
+])
+
+MALFORMED_ANSWERS = [
+    "I'm sorry, I can't help with analyzing this image.",
+    ANSWER[: len(ANSWER) // 3],  # cut off mid-object
+]
+
+app = FastAPI()
+
+
+# -----------------------------
+# Behaviour
+# -----------------------------
+def _latency(profile):
+    median = profile["latency_ms"] / 1000.0
+    sigma = profile["latency_sigma"]
+    return median * math.exp(random.gauss(0, sigma)) if sigma > 0 else median
+
+
+def _outcome(provider):
+    """Pick what this call does: 'rate_limited', 'error', 'malformed' or 'ok'."""
+    profile = profiles[provider]
+    roll = random.random()
+    for outcome, key in (("rate_limited", "rate_limit_rate"), ("error", "error_rate"), ("malformed", "malformed_rate")):
+        if roll < profile[key]:
+            served[provider][outcome] += 1
+            return outcome
+        roll -= profile[key]
+    served[provider]["ok"] += 1
+    return "ok"
+
+
+def _failure(provider, outcome):
+    if outcome == "rate_limited":
+        return JSONResponse(
+            {"error": {"code": 429, "message": "Rate limit exceeded (mock)"}},
+            status_code=429,
+            headers={"Retry-After": str(profiles[provider]["retry_after"])},
+        )
+    return JSONResponse({"error": {"code": 500, "message": "Internal error (mock)"}}, status_code=500)
+
+
+def _answer(outcome):
+    return random.choice(MALFORMED_ANSWERS) if outcome == "malformed" else ANSWER
+
+
+def _chunks(text, count):
+    size = max(1, math.ceil(len(text) / max(1, count)))
+    return [text[index:index + size] for index in range(0, len(text), size)]
+
+
+async def _sse(provider, events):
+    """Spread the profile latency over the chunks of a streamed answer."""
+    delay = _latency(profiles[provider]) / max(1, len(events))
+    for event in events:
+        await asyncio.sleep(delay)
+        yield f"data: {event}\n\n"
+
+
+# -----------------------------
+# Gemini
+# -----------------------------
+@app.post("/gemini/models/{model_action}")
+async def gemini_generate(model_action: str, request: Request):
+    await request.body()
+    outcome = _outcome("gemini")
+    streaming = model_action.endswith(":streamGenerateContent")
+    if outcome in ("rate_limited", "error"):
+        await asyncio.sleep(_latency(profiles["gemini"]) / 4)
+        return _failure("gemini", outcome)
+
+    text = _answer(outcome)
+    if streaming:
+        events = [
+            json.dumps({"candidates": [{"content": {"parts": [{"text": chunk}], "role": "model"}}]})
+            for chunk in _chunks(text, profiles["gemini"]["stream_chunks"])
+        ]
+        return StreamingResponse(_sse("gemini", events), media_type="text/event-stream")
+
+    await asyncio.sleep(_latency(profiles["gemini"]))
+    return {
+        "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP"}],
+        "usageMetadata": {"promptTokenCount": 1800, "candidatesTokenCount": 300},
+    }
+
+
+@app.post("/gemini/cachedContents")
+async def gemini_cached_contents():
+    # No context caching here, so the app sends the prompt inline
+    return JSONResponse({"error": {"code": 400, "message": "Context caching not supported (mock)"}}, status_code=400)
+
+
+# -----------------------------
+# OpenAI-compatible Chat Completions
+# -----------------------------
+@app.post("/{provider}/chat/completions")
+async def chat_completions(provider: str, request: Request):
+    if provider not in PROVIDERS:
+        return JSONResponse({"error": "unknown provider"}, status_code=404)
+    body = await request.json()
+    outcome = _outcome(provider)
+    if outcome in ("rate_limited", "error"):
+        await asyncio.sleep(_latency(profiles[provider]) / 4)
+        return _failure(provider, outcome)
+
+    text = _answer(outcome)
+    if body.get("stream"):
+        events = [
+            json.dumps({"choices": [{"index": 0, "delta": {"content": chunk}}]})
+            for chunk in _chunks(text, profiles[provider]["stream_chunks"])
+        ] + ["[DONE]"]
+        return StreamingResponse(_sse(provider, events), media_type="text/event-stream")
+
+    await asyncio.sleep(_latency(profiles[provider]))
+    return {
+        "id": "mock",
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1800, "completion_tokens": 300},
+    }
+
+
+# -----------------------------
+# Model Listings
+# -----------------------------
+@app.get("/{provider}/models")
+async def models(provider: str):
+    if provider == "gemini":
+        return {"models": [{"name": "models/gemini-2.5-flash", "supportedGenerationMethods": ["generateContent"]}]}
+    return {"data": []}
+
+
+# -----------------------------
+# Control
+# -----------------------------
+@app.post("/_scenario")
+async def set_scenario(request: Request):
+    """Body: {"providers": {provider: {profile overrides}}, "seed": int}.
+    Providers left out get the defaults; the seed makes runs repeatable."""
+    body = await request.json()
+    for name in PROVIDERS:
+        profiles[name] = {**DEFAULT_PROFILE, **body.get("providers", {}).get(name, {})}
+    random.seed(body.get("seed"))
+    served.clear()
+    return profiles
+
+
+@app.get("/_stats")
+async def stats():
+    return {name: dict(counts) for name, counts in served.items()}
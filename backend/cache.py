@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "256"))
+ANALYSIS_CACHE_TTL_SECONDS = float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "86400"))
+# Path of the SQLite file backing the persistent tier; empty disables it
+ANALYSIS_CACHE_DB = os.getenv("ANALYSIS_CACHE_DB", "")
+# Let concurrent identical requests share one upstream call
+COALESCE_IN_FLIGHT = os.getenv("COALESCE_IN_FLIGHT", "true").lower() in ("1", "true", "yes")
+
+
+# -----------------------------
+# Cache Key
+# -----------------------------
+def make_cache_key(images, prompt, model_id) -> str:
+    """Hash the decoded image bytes (ImagePayload digests) together with
+    the prompt and model id, so the same photo sent with a different
+    data-URI header still hits."""
+    digest = hashlib.sha256()
+    for image in images:
+        digest.update(image.digest)
+    digest.update(b"\0prompt\0" + prompt.encode())
+    digest.update(b"\0model\0" + model_id.encode())
+    return digest.hexdigest()
+
+
+# -----------------------------
+# Persistent Tier
+# -----------------------------
+class SQLiteStore:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM analysis_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._conn.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, value, expires_at)"
+                " VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._conn.execute(
+                "DELETE FROM analysis_cache WHERE expires_at < ?", (time.time(),)
+            )
+            self._conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# -----------------------------
+# Two-Tier Analysis Cache
+# -----------------------------
+class AnalysisCache:
+    """Bounded in-memory LRU with TTL, optionally backed by SQLite so
+    results survive restarts. Disk access runs off the event loop."""
+
+    def __init__(self, max_entries=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL_SECONDS, db_path=ANALYSIS_CACHE_DB):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._store = SQLiteStore(db_path) if db_path else None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _remember(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at >= time.time():
+                self._entries.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return value
+            del self._entries[key]
+
+        if self._store is not None:
+            entry = await asyncio.to_thread(self._store.get, key)
+            if entry is not None:
+                value, expires_at = entry
+                self._remember(key, value, expires_at)
+                self.stats["disk_hits"] += 1
+                return value
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key, value):
+        expires_at = time.time() + self.ttl
+        self._remember(key, value, expires_at)
+        self.stats["stores"] += 1
+        if self._store is not None:
+            await asyncio.to_thread(self._store.set, key, value, expires_at)
+
+    def snapshot(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "disk_entries": self._store.count() if self._store is not None else None,
+        }
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+
+
+# -----------------------------
+# Single-Flight Coalescing
+# -----------------------------
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one.
+
+    The first caller starts the work as a task; callers arriving while it
+    runs await that same task, and its result or exception reaches all of
+    them. A cancelled caller only stops waiting: the work is cancelled
+    once nobody is left waiting for it.
+    """
+
+    def __init__(self, enabled=COALESCE_IN_FLIGHT):
+        self.enabled = enabled
+        self._flights = {}  # key -> [task, waiters]
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _finished(self, key, flight, task):
+        self._forget(key, flight)
+        # Mark the exception retrieved even if every waiter already left
+        if not task.cancelled():
+            task.exception()
+
+    async def run(self, key, start):
+        """Return (result, coalesced) where coalesced says whether this
+        caller joined a call another request had already started."""
+        if not self.enabled:
+            return await start(), False
+
+        flight = self._flights.get(key)
+        coalesced = flight is not None
+        if coalesced:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["leaders"] += 1
+            task = asyncio.ensure_future(start())
+            flight = self._flights[key] = [task, 0]
+            task.add_done_callback(lambda done: self._finished(key, flight, done))
+
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task), coalesced
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not task.done():
+                # Last waiter gone; don't let a later arrival join a
+                # call that is being torn down
+                self._forget(key, flight)
+                task.cancel()
+
+    def snapshot(self):
+        return {**self.stats, "in_flight": len(self._flights), "enabled": self.enabled}
+
+
+analysis_cache = AnalysisCache()
+analysis_flights = SingleFlight()
@@ -0,0 +1,347 @@
+import asyncio
+import os
+import re
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from keypool import KEY_POOLS, parse_keys
+from metrics import log_event
+from providers import (
+    close_http_client,
+    get_http_client,
+    GEMINI_BASE_URL,
+    GROQ_BASE_URL,
+    OPENROUTER_BASE_URL,
+    PROVIDER_MODELS,
+)
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+
+# Refresh a provider's model list at most this often; the background task
+# started by app.py wakes up on the same interval
+CATALOG_TTL_SECONDS = int(os.getenv("CATALOG_TTL_SECONDS", "3600"))
+CATALOG_TIMEOUT_SECONDS = float(os.getenv("CATALOG_TIMEOUT_SECONDS", "15"))
+
+# Replace a configured model that the provider no longer lists, marks
+# inactive or does not accept images for
+AUTO_SELECT_MODELS = os.getenv("AUTO_SELECT_MODELS", "false").lower() in ("1", "true", "yes")
+PREFER_FREE_MODELS = os.getenv("PREFER_FREE_MODELS", "true").lower() in ("1", "true", "yes")
+
+# Listed providers expose no modality field, so vision support is inferred from the id
+_GROQ_VISION = re.compile(r"vision|llama-4|-vl\b", re.IGNORECASE)
+_OPENAI_VISION = re.compile(r"gpt-4o|gpt-4\.1|gpt-5|^o[134]\b|^o[134]-|vision", re.IGNORECASE)
+_GEMINI_NOT_VISION = re.compile(r"embedding|tts|imagen|aqa|native-audio|image-generation", re.IGNORECASE)
+
+
+def _price(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _model(provider, model_id, **fields):
+    """One catalog entry; every provider is normalized to the same fields."""
+    entry = {
+        "provider": provider,
+        "id": model_id,
+        "owned_by": None,
+        "context_window": None,
+        "max_output_tokens": None,
+        "prompt_price": None,  # USD per token
+        "completion_price": None,
+        "input_modalities": [],
+        "vision": False,
+        "free": None,
+        "active": True,
+    }
+    entry.update(fields)
+    return entry
+
+
+# -----------------------------
+# Provider Listings
+# -----------------------------
+def _openrouter_model(raw):
+    pricing = raw.get("pricing") or {}
+    modalities = (raw.get("architecture") or {}).get("input_modalities") or []
+    prompt_price = _price(pricing.get("prompt"))
+    completion_price = _price(pricing.get("completion"))
+    return _model(
+        "openrouter",
+        raw["id"],
+        owned_by=raw["id"].split("/", 1)[0],
+        context_window=raw.get("context_length"),
+        max_output_tokens=(raw.get("top_provider") or {}).get("max_completion_tokens"),
+        prompt_price=prompt_price,
+        completion_price=completion_price,
+        input_modalities=modalities,
+        vision="image" in modalities,
+        free=prompt_price == 0 and completion_price == 0,
+    )
+
+
+def _groq_model(raw):
+    return _model(
+        "groq",
+        raw["id"],
+        owned_by=raw.get("owned_by"),
+        context_window=raw.get("context_window"),
+        max_output_tokens=raw.get("max_completion_tokens"),
+        input_modalities=["text", "image"] if _GROQ_VISION.search(raw["id"]) else ["text"],
+        vision=bool(_GROQ_VISION.search(raw["id"])),
+        active=raw.get("active", True),
+    )
+
+
+def _openai_model(raw):
+    vision = bool(_OPENAI_VISION.search(raw["id"]))
+    return _model(
+        "openai",
+        raw["id"],
+        owned_by=raw.get("owned_by"),
+        input_modalities=["text", "image"] if vision else ["text"],
+        vision=vision,
+        free=False,
+    )
+
+
+def _gemini_model(raw):
+    model_id = raw["name"].removeprefix("models/")
+    methods = raw.get("supportedGenerationMethods") or []
+    vision = "generateContent" in methods and not _GEMINI_NOT_VISION.search(model_id)
+    return _model(
+        "gemini",
+        model_id,
+        owned_by="google",
+        context_window=raw.get("inputTokenLimit"),
+        max_output_tokens=raw.get("outputTokenLimit"),
+        input_modalities=["text", "image"] if vision else ["text"],
+        vision=vision,
+    )
+
+
+def _bearer(key):
+    return {"Authorization": f"Bearer {key}"} if key else {}
+
+
+def _first_key(name):
+    pool = KEY_POOLS.get(name)
+    if pool and pool.keys:
+        return pool.keys[0].value
+    return None
+
+
+# name -> (url, auth headers, parse one raw entry, key required)
+def _listing(name):
+    if name == "openrouter":
+        return f"{OPENROUTER_BASE_URL}/models", _bearer(_first_key(name)), _openrouter_model, False
+    if name == "groq":
+        key = _first_key(name)
+        return f"{GROQ_BASE_URL}/models", _bearer(key), _groq_model, True
+    if name == "openai":
+        keys = parse_keys("OPENAI_API_KEY")
+        return f"{OPENAI_BASE_URL}/models", _bearer(keys[0] if keys else None), _openai_model, True
+    if name == "gemini":
+        key = _first_key(name)
+        return f"{GEMINI_BASE_URL}/models", {"x-goog-api-key": key} if key else {}, _gemini_model, True
+    raise ValueError(f"Unknown catalog provider: {name}")
+
+
+CATALOG_PROVIDERS = ["gemini", "openrouter", "groq", "openai"]
+
+
+# -----------------------------
+# Model Catalog
+# -----------------------------
+class ModelCatalog:
+    """Model listings of every provider, fetched concurrently and kept for
+    CATALOG_TTL_SECONDS.
+
+    Refreshes are conditional (If-None-Match / If-Modified-Since), so an
+    unchanged listing costs a 304. Readers only ever see the last complete
+    snapshot; nothing here runs on the request path.
+    """
+
+    def __init__(self, providers=None):
+        self.providers = list(providers or CATALOG_PROVIDERS)
+        self._entries = {}  # provider -> {"models", "fetched_at", "etag", "last_modified", "error"}
+        self._locks = {}
+
+    def models(self, provider=None):
+        names = [provider] if provider else self.providers
+        return [model for name in names for model in self._entries.get(name, {}).get("models", [])]
+
+    def find(self, provider, model_id):
+        for model in self.models(provider):
+            if model["id"] == model_id:
+                return model
+        return None
+
+    def is_fresh(self, name):
+        fetched_at = self._entries.get(name, {}).get("fetched_at")
+        return fetched_at is not None and time.monotonic() - fetched_at < CATALOG_TTL_SECONDS
+
+    async def refresh(self, name, force=False):
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            if not force and self.is_fresh(name):
+                return
+            entry = self._entries.setdefault(
+                name, {"models": [], "fetched_at": None, "etag": None, "last_modified": None, "error": None}
+            )
+            try:
+                await self._fetch(name, entry)
+                entry["error"] = None
+            except Exception as e:
+                entry["error"] = str(e) or type(e).__name__
+                log_event("catalog_refresh_failed", provider=name, error=entry["error"])
+
+    async def refresh_all(self, providers=None, force=False):
+        """One parallel round over every provider."""
+        await asyncio.gather(*(self.refresh(name, force) for name in providers or self.providers))
+
+    async def _fetch(self, name, entry):
+        url, headers, parse, key_required = _listing(name)
+        if key_required and not headers:
+            raise RuntimeError("no API key configured")
+
+        conditional = dict(headers)
+        if entry["models"] and entry["etag"]:
+            conditional["If-None-Match"] = entry["etag"]
+        if entry["models"] and entry["last_modified"]:
+            conditional["If-Modified-Since"] = entry["last_modified"]
+
+        client = get_http_client()
+        params = {"pageSize": 1000} if name == "gemini" else None
+        response = await client.get(url, headers=conditional, params=params, timeout=CATALOG_TIMEOUT_SECONDS)
+        if response.status_code == 304:
+            entry["fetched_at"] = time.monotonic()
+            return
+        response.raise_for_status()
+
+        body = response.json()
+        raw_models = body.get("models" if name == "gemini" else "data") or []
+        # Gemini pages its listing; follow the token with the same key
+        while name == "gemini" and body.get("nextPageToken"):
+            page = await client.get(
+                url,
+                headers=headers,
+                params={"pageSize": 1000, "pageToken": body["nextPageToken"]},
+                timeout=CATALOG_TIMEOUT_SECONDS,
+            )
+            page.raise_for_status()
+            body = page.json()
+            raw_models += body.get("models") or []
+
+        entry["models"] = [parse(raw) for raw in raw_models]
+        entry["etag"] = response.headers.get("etag")
+        entry["last_modified"] = response.headers.get("last-modified")
+        entry["fetched_at"] = time.monotonic()
+
+    def snapshot(self):
+        now = time.monotonic()
+        return {
+            name: {
+                "models": len(entry["models"]),
+                "vision_models": sum(1 for model in entry["models"] if model["vision"]),
+                "age_seconds": None if entry["fetched_at"] is None else round(now - entry["fetched_at"], 1),
+                "error": entry["error"],
+            }
+            for name, entry in self._entries.items()
+        }
+
+    # -----------------------------
+    # Vision Model Selection
+    # -----------------------------
+    def pick_vision_model(self, provider):
+        candidates = [model for model in self.models(provider) if model["vision"] and model["active"]]
+        if not candidates:
+            return None
+        candidates.sort(
+            key=lambda model: (
+                not (PREFER_FREE_MODELS and model["free"]),
+                -(model["context_window"] or 0),
+                model["id"],
+            )
+        )
+        return candidates[0]
+
+    def select_models(self, models=None):
+        """Swap out configured models that are gone, inactive or text-only.
+
+        Works on the cached snapshot only and updates the models dict in
+        place, so dispatch, cache keys and the Gemini context cache pick up
+        the change on their next read. A provider whose listing failed keeps
+        its configured model.
+        """
+        models = PROVIDER_MODELS if models is None else models
+        changes = {}
+        for provider, configured in models.items():
+            if not self.models(provider):
+                continue
+            current = self.find(provider, configured)
+            if current and current["active"] and current["vision"]:
+                continue
+            replacement = self.pick_vision_model(provider)
+            if replacement and replacement["id"] != configured:
+                log_event("catalog_model_replaced", provider=provider, previous=configured, model=replacement["id"])
+                models[provider] = replacement["id"]
+                changes[provider] = {"from": configured, "to": replacement["id"]}
+        return changes
+
+    async def run(self, providers=None):
+        """Background loop for the app lifespan: refresh, reselect, sleep.
+        providers limits the listings fetched, e.g. to the enabled chain."""
+        names = self.providers if providers is None else [name for name in providers if name in self.providers]
+        while True:
+            if names:
+                await self.refresh_all(names)
+            if AUTO_SELECT_MODELS:
+                self.select_models()
+            await asyncio.sleep(CATALOG_TTL_SECONDS)
+
+
+model_catalog = ModelCatalog()
+
+
+def list_models(*providers):
+    """Fetch the listed providers (all by default) in one parallel round
+    for command-line use, and return the catalog."""
+    async def run():
+        try:
+            await model_catalog.refresh_all(list(providers) or None, force=True)
+        finally:
+            await close_http_client()
+
+    asyncio.run(run())
+    return model_catalog
+
+
+if __name__ == "__main__":
+    from tabulate import tabulate
+
+    catalog = list_models()
+    table_data = [
+        [
+            model["provider"],
+            model["id"],
+            model["context_window"],
+            model["max_output_tokens"],
+            model["prompt_price"],
+            "yes" if model["vision"] else "",
+            "yes" if model["free"] else "",
+            model["active"],
+        ]
+        for model in catalog.models()
+    ]
+    print(tabulate(table_data,
+                headers=["Provider", "Model ID", "Context", "Max Output", "Prompt Price", "Vision", "Free", "Active"],
+                tablefmt="grid"))
+
+    for name, state in catalog.snapshot().items():
+        if state["error"]:
+            print(f"{name}: {state['error']}")
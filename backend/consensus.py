@@ -0,0 +1,201 @@
+import os
+import re
+from collections import Counter
+from difflib import SequenceMatcher
+
+import numpy as np
+
+# Two findings are the same condition when their names are at least this
+# similar (0..1) and their locations at least CONSENSUS_LOCATION_SIMILARITY
+CONSENSUS_NAME_SIMILARITY = float(os.getenv("CONSENSUS_NAME_SIMILARITY", "0.6"))
+CONSENSUS_LOCATION_SIMILARITY = float(os.getenv("CONSENSUS_LOCATION_SIMILARITY", "0.3"))
+# Boxes of one condition on one image overlapping at least this much are fused
+CONSENSUS_IOU_THRESHOLD = float(os.getenv("CONSENSUS_IOU_THRESHOLD", "0.4"))
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+# -----------------------------
+# Field Coercion
+# -----------------------------
+# Model output is only loosely schema-checked, so every field read here may
+# be missing or of the wrong type; bad values are coerced or skipped.
+def _text(value):
+    return value if isinstance(value, str) else ""
+
+
+def _confidence(value):
+    """0..100 from a number or a string like "85" / "85%"; 0 otherwise."""
+    if isinstance(value, str):
+        value = value.strip().rstrip("%").strip()
+    if isinstance(value, bool):
+        return 0.0
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    if value != value:  # NaN
+        return 0.0
+    return min(100.0, max(0.0, value))
+
+
+# -----------------------------
+# Text Similarity
+# -----------------------------
+def _tokens(text):
+    # Crude singularization so "papules" / "papule" and "cheeks" / "cheek" agree
+    return {word[:-1] if len(word) > 3 and word.endswith("s") else word for word in _WORD.findall(text.lower())}
+
+
+def similarity(a, b):
+    """Best of character-level ratio and word overlap, 0..1."""
+    a, b = _text(a).strip().lower(), _text(b).strip().lower()
+    if not a or not b:
+        return 1.0 if a == b else 0.0
+    tokens_a, tokens_b = _tokens(a), _tokens(b)
+    overlap = len(tokens_a & tokens_b) / len(tokens_a | tokens_b) if tokens_a and tokens_b else 0.0
+    return max(SequenceMatcher(None, a, b).ratio(), overlap)
+
+
+def _same_condition(a, b):
+    if similarity(a.get("name"), b.get("name")) < CONSENSUS_NAME_SIMILARITY:
+        return False
+    # A provider that gives no location doesn't get to veto the match
+    if not _text(a.get("location")).strip() or not _text(b.get("location")).strip():
+        return True
+    return similarity(a["location"], b["location"]) >= CONSENSUS_LOCATION_SIMILARITY
+
+
+# -----------------------------
+# Box Fusion
+# -----------------------------
+def pairwise_iou(boxes):
+    """(N, 4) x1,y1,x2,y2 -> (N, N) intersection over union."""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    width = np.clip(np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :]), 0, None)
+    height = np.clip(np.minimum(y2[:, None], y2[None, :]) - np.maximum(y1[:, None], y1[None, :]), 0, None)
+    intersection = width * height
+    union = areas[:, None] + areas[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def fuse_boxes(boxes, scores, iou_threshold=CONSENSUS_IOU_THRESHOLD):
+    """Weighted box fusion: cluster boxes around the highest-scoring
+    unassigned box by IoU, then average each cluster weighted by score.
+    Returns (fused (M, 4), cluster sizes (M,)), highest score first."""
+    count = len(boxes)
+    iou = pairwise_iou(boxes)
+    labels = np.full(count, -1)
+    clusters = 0
+    for index in np.argsort(-scores, kind="stable"):
+        if labels[index] >= 0:
+            continue
+        labels[(labels < 0) & (iou[index] >= iou_threshold)] = clusters
+        labels[index] = clusters  # degenerate boxes have IoU 0 with themselves
+        clusters += 1
+
+    weights = np.maximum(scores, 1e-6)
+    totals = np.bincount(labels, weights=weights, minlength=clusters)
+    fused = np.stack([
+        np.bincount(labels, weights=boxes[:, axis] * weights, minlength=clusters) / totals
+        for axis in range(4)
+    ], axis=1)
+    return fused, np.bincount(labels, minlength=clusters)
+
+
+def _box_array(box):
+    try:
+        x1, y1, x2, y2 = (float(box[key]) for key in ("x1", "y1", "x2", "y2"))
+    except (KeyError, TypeError, ValueError):
+        return None
+    return [min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)]
+
+
+def _fused_bounding_boxes(members):
+    """Fuse the boxes of one condition cluster, separately per image."""
+    by_image = {}
+    for condition in members:
+        boxes = condition.get("boundingBoxes")
+        for box in boxes if isinstance(boxes, list) else []:
+            if not isinstance(box, dict) or not isinstance(box.get("box"), dict):
+                continue
+            image_id = box.get("imageId")
+            if not isinstance(image_id, int) or isinstance(image_id, bool):
+                continue
+            coords = _box_array(box["box"])
+            if coords is None:
+                continue
+            rows, scores = by_image.setdefault(image_id, ([], []))
+            rows.append(coords)
+            scores.append(_confidence(condition.get("confidence")))
+
+    fused_boxes = []
+    for image_id, (rows, scores) in by_image.items():
+        fused, _ = fuse_boxes(np.asarray(rows, dtype=np.float64), np.asarray(scores, dtype=np.float64))
+        fused = np.clip(fused, 0.0, 1.0).round(4)
+        fused_boxes.extend(
+            {"imageId": image_id, "box": dict(zip(("x1", "y1", "x2", "y2"), row.tolist()))}
+            for row in fused
+        )
+    return fused_boxes
+
+
+# -----------------------------
+# Result Fusion
+# -----------------------------
+def _categories(result):
+    if isinstance(result, dict):
+        result = [result]
+    return [category for category in result or [] if isinstance(category, dict)]
+
+
+def fuse_results(results):
+    """Merge SkinConditionCategory[] answers from several providers.
+
+    Findings are clustered by name and location similarity, taking at most
+    one finding per provider into each cluster. Every cluster becomes one
+    condition: text from its most confident finding, boxes fused per image,
+    and confidence = mean confidence scaled by agreement (a finding every
+    provider reported keeps its mean; one only a single provider of two
+    reported keeps three quarters of it). Nothing is dropped, so recall is
+    the union of the providers'.
+    """
+    findings = []  # (provider index, category name, condition)
+    for provider, result in enumerate(results):
+        for category in _categories(result):
+            conditions = category.get("conditions")
+            for condition in conditions if isinstance(conditions, list) else []:
+                if isinstance(condition, dict) and _text(condition.get("name")).strip():
+                    findings.append((provider, _text(category.get("category")) or "Other", condition))
+    findings.sort(key=lambda finding: -_confidence(finding[2].get("confidence")))
+
+    clusters = []  # [set of providers, [(category, condition), ...]]
+    for provider, category, condition in findings:
+        for providers, members in clusters:
+            if provider not in providers and _same_condition(members[0][1], condition):
+                providers.add(provider)
+                members.append((category, condition))
+                break
+        else:
+            clusters.append([{provider}, [(category, condition)]])
+
+    fused = {}
+    for providers, members in clusters:
+        conditions = [condition for _, condition in members]
+        lead = conditions[0]
+        agreement = len(providers) / len(results)
+        mean_confidence = sum(_confidence(condition.get("confidence")) for condition in conditions) / len(conditions)
+        # Most common category among the members; ties go to the most confident
+        category = Counter(name for name, _ in members).most_common(1)[0][0]
+        fused.setdefault(category, []).append({
+            **lead,
+            "confidence": round(min(100.0, mean_confidence * (0.5 + 0.5 * agreement))),
+            "agreement": round(agreement, 2),
+            "boundingBoxes": _fused_bounding_boxes(conditions),
+        })
+
+    return [
+        {"category": category, "conditions": sorted(conditions, key=lambda condition: -condition["confidence"])}
+        for category, conditions in fused.items()
+    ]
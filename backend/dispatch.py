@@ -0,0 +1,159 @@
+import asyncio
+import os
+
+from consensus import fuse_results
+from metrics import instrument_provider, log_event, span, PROVIDER_FAILOVERS
+from providers import PROVIDER_MODELS
+from ratelimit import rate_limited
+from registry import check_chain, provider_call, provider_stream
+from router import provider_router
+
+# "sequential" waits for each provider to fail before trying the next one,
+# "hedged" starts the next provider after HEDGE_DELAY_SECONDS,
+# "race" starts every provider in the chain at once and
+# "consensus" waits for every provider and fuses their answers.
+DISPATCH_MODE = os.getenv("DISPATCH_MODE", "sequential").lower()
+HEDGE_DELAY_SECONDS = float(os.getenv("HEDGE_DELAY_SECONDS", "5"))
+# Reorder the chain by live latency / circuit-breaker state instead of PROVIDER_CHAIN order
+ADAPTIVE_ROUTING = os.getenv("ADAPTIVE_ROUTING", "true").lower() in ("1", "true", "yes")
+
+# Which providers are enabled, in failover order (see registry.PROVIDERS;
+# "hf" runs the local model in-process). Groq stays out of the default
+# chain until its vision model is re-enabled.
+PROVIDER_CHAIN = check_chain([
+    name.strip().lower()
+    for name in os.getenv("PROVIDER_CHAIN", "gemini,openrouter").split(",")
+    if name.strip()
+])
+
+PROVIDER_FUNCTIONS = {name: provider_call(name) for name in PROVIDER_CHAIN}
+STREAM_FUNCTIONS = {name: provider_stream(name) for name in PROVIDER_CHAIN}
+
+
+def get_provider_chain():
+    providers = [(name, PROVIDER_FUNCTIONS[name]) for name in PROVIDER_CHAIN]
+    if ADAPTIVE_ROUTING:
+        providers = provider_router.route(providers)
+    # Budget waits sit outside the router and the metrics so they never count as provider latency
+    return [(name, rate_limited(name, instrument_provider(name, call))) for name, call in providers]
+
+
+def get_stream_chain():
+    """Streaming counterparts of the chain, in the router's current order.
+    Providers that cannot stream are left out."""
+    providers = [(name, PROVIDER_FUNCTIONS[name]) for name in PROVIDER_CHAIN if STREAM_FUNCTIONS[name]]
+    if ADAPTIVE_ROUTING:
+        providers = provider_router.order(providers)
+    return [(name, STREAM_FUNCTIONS[name]) for name, _ in providers]
+
+
+def chain_model_id(mode=None):
+    """Identify the models behind the chain, e.g. for cache keys. Fused
+    consensus answers are kept apart from single-provider ones."""
+    model_id = ",".join(f"{name}:{PROVIDER_MODELS[name]}" for name in PROVIDER_CHAIN)
+    if (mode or DISPATCH_MODE).lower() == "consensus":
+        model_id = "consensus|" + model_id
+    return model_id
+
+
+# -----------------------------
+# Sequential Failover
+# -----------------------------
+async def dispatch_sequential(providers, images, prompt):
+    for name, call in providers:
+        result = await call(images, prompt)
+        if result:
+            return result, name
+    return None, None
+
+
+# -----------------------------
+# Hedged / Racing Dispatch
+# -----------------------------
+async def dispatch_hedged(providers, images, prompt, hedge_delay):
+    """Start providers one hedge_delay apart (all at once when it is 0) and
+    return the first non-empty result, cancelling whatever is still running.
+
+    A provider that fails early releases the next one immediately instead
+    of waiting out the rest of its hedge delay.
+    """
+    remaining = list(providers)
+    running = {}
+
+    def launch():
+        name, call = remaining.pop(0)
+        running[asyncio.ensure_future(call(images, prompt))] = name
+
+    try:
+        launch()
+        while hedge_delay <= 0 and remaining:
+            launch()
+
+        while running:
+            done, _ = await asyncio.wait(
+                running,
+                timeout=hedge_delay if remaining else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+
+            for task in done:
+                name = running.pop(task)
+                if task.exception() is None and task.result():
+                    return task.result(), name
+
+            if remaining:
+                launch()
+
+        return None, None
+    finally:
+        for task in running:
+            task.cancel()
+
+
+# -----------------------------
+# Consensus Dispatch
+# -----------------------------
+async def dispatch_consensus(providers, images, prompt):
+    """Ask every provider at once and fuse whatever comes back, so latency
+    is that of the slowest provider. Falls back to a single answer when
+    only one provider succeeds, or when fusing the answers fails."""
+    outcomes = await asyncio.gather(*(call(images, prompt) for _, call in providers), return_exceptions=True)
+    answered = [
+        (name, outcome)
+        for (name, _), outcome in zip(providers, outcomes)
+        if outcome and not isinstance(outcome, BaseException)
+    ]
+    if not answered:
+        return None, None
+    if len(answered) == 1:
+        return answered[0][1], answered[0][0]
+
+    try:
+        with span("fuse"):
+            result = fuse_results([outcome for _, outcome in answered])
+    except Exception as e:
+        # Answers are in the router's order, so the first is from the best-ranked provider
+        log_event("consensus_fuse_failed", providers=[name for name, _ in answered], error=str(e))
+        return answered[0][1], answered[0][0]
+    # Name the providers in configured order, whatever order the router used
+    names = sorted((name for name, _ in answered), key=PROVIDER_CHAIN.index)
+    return result, "consensus:" + "+".join(names)
+
+
+async def dispatch(images, prompt, mode=None):
+    """Run the provider chain and return (result, provider_name)."""
+    mode = (mode or DISPATCH_MODE).lower()
+    providers = get_provider_chain()
+
+    if mode == "hedged":
+        result, name = await dispatch_hedged(providers, images, prompt, HEDGE_DELAY_SECONDS)
+    elif mode == "race":
+        result, name = await dispatch_hedged(providers, images, prompt, 0)
+    elif mode == "consensus":
+        return await dispatch_consensus(providers, images, prompt)
+    else:
+        result, name = await dispatch_sequential(providers, images, prompt)
+
+    if name and name != providers[0][0]:
+        PROVIDER_FAILOVERS.inc(from_provider=providers[0][0], to_provider=name)
+    return result, name
@@ -0,0 +1,575 @@
+import asyncio
+import copy
+import io
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_import_started = time.perf_counter()
+import torch
+from PIL import Image
+from transformers import (
+    AsyncTextIteratorStreamer,
+    AutoProcessor,
+    DynamicCache,
+    LlavaForConditionalGeneration,
+    StoppingCriteria,
+    StoppingCriteriaList,
+)
+_import_seconds = round(time.perf_counter() - _import_started, 3)
+
+from metrics import log_event
+from parsing import extract_json
+from prompts import get_prompt
+
+HF_MODEL_ID = os.getenv("HF_MODEL_ID", "llava-hf/llava-1.5-7b-hf")
+HF_MAX_NEW_TOKENS = int(os.getenv("HF_MAX_NEW_TOKENS", "1024"))
+# Stop a row as soon as its output holds one complete, valid JSON value
+HF_STOP_ON_JSON = os.getenv("HF_STOP_ON_JSON", "true").lower() in ("1", "true", "yes")
+
+# Dynamic batching: wait up to HF_BATCH_WINDOW_MS after the first request
+# for more to arrive, then run them through generate together
+HF_MAX_BATCH_SIZE = int(os.getenv("HF_MAX_BATCH_SIZE", "4"))
+HF_BATCH_WINDOW_MS = float(os.getenv("HF_BATCH_WINDOW_MS", "50"))
+
+# Requests waiting for the model beyond this are turned away with a 503
+HF_QUEUE_SIZE = int(os.getenv("HF_QUEUE_SIZE", "32"))
+HF_DECODE_WORKERS = int(os.getenv("HF_DECODE_WORKERS", "2"))
+# Retry-After sent with the 503
+HF_RETRY_AFTER_SECONDS = int(os.getenv("HF_RETRY_AFTER_SECONDS", "5"))
+
+# gpu:      float16 weights placed by device_map="auto"
+# cpu:      float32 on the CPU, for nodes without a GPU
+# cpu-int8: float32 on the CPU with every Linear layer dynamically
+#           quantized to int8 (smaller, and usually ~2x faster to decode)
+HF_INFERENCE_MODE = os.getenv("HF_INFERENCE_MODE", "gpu").lower()
+# Intra-op threads for the CPU modes; 0 leaves torch's default (physical cores)
+HF_CPU_THREADS = int(os.getenv("HF_CPU_THREADS", "0"))
+
+# Prefill the fixed instruction text once at load and start every request from a copy of its KV cache
+HF_PREFIX_CACHE = os.getenv("HF_PREFIX_CACHE", "true").lower() in ("1", "true", "yes")
+# A shorter prefix saves less prefill than copying its cache costs per batch
+HF_PREFIX_MIN_TOKENS = int(os.getenv("HF_PREFIX_MIN_TOKENS", "64"))
+
+# Load the model on the worker thread when the app starts (false: on the first request)
+HF_LOAD_ON_STARTUP = os.getenv("HF_LOAD_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+prompt = get_prompt("skin-analysis-local")
+
+# Filled in by load_model(); nothing heavy happens at import time
+processor = None
+model = None
+text_prompt = None
+prefix_ids = None     # tokens before the first image token, shape (1, P)
+prefix_cache = None   # their key/value cache
+
+PREFIX_CACHE_STATS = {"prefix_tokens": 0, "batches": 0, "fallbacks": 0, "tokens_skipped": 0}
+GENERATION_STATS = {"rows": 0, "stopped_on_json": 0, "cancelled": 0, "new_tokens": 0}
+
+STARTUP_REPORT = {"state": "not_loaded", "mode": HF_INFERENCE_MODE, "phases": {"import": _import_seconds}, "error": None}
+_model_ready = threading.Event()
+
+
+def build_text_prompt():
+    """The llava-1.5 conversation format, written out by hand.
+
+    apply_chat_template would put the image first whatever the content
+    order, leaving only "USER: " in front of it. Instructions before the
+    image make the tokens that never change a prefix whose KV cache can be
+    reused (see build_prefix_cache).
+    """
+    image_token = getattr(processor, "image_token", None) or "<image>"
+    return f"USER: {prompt.text.strip()}\n{image_token}\nASSISTANT:"
+
+
+# -----------------------------
+# Model Loading
+# -----------------------------
+def _timed(phase, load):
+    started = time.perf_counter()
+    result = load()
+    STARTUP_REPORT["phases"][phase] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def build_prefix_cache():
+    """Prefill everything before the image token once.
+
+    The image placeholder expands to a fixed number of tokens, so with the
+    instructions first every request shares these exact leading tokens.
+    """
+    tokens = processor.tokenizer(text_prompt, return_tensors="pt")["input_ids"]
+    image_positions = (tokens[0] == model.config.image_token_index).nonzero()
+    if len(image_positions) == 0:
+        return None, None
+
+    prefix_length = int(image_positions[0])
+    cached = prefix_length >= HF_PREFIX_MIN_TOKENS
+    log_event("local_prefix_cache", prefix_tokens=prefix_length, min_tokens=HF_PREFIX_MIN_TOKENS, cached=cached)
+    if not cached:
+        return None, None
+
+    ids = tokens[:, :prefix_length].to(model.device)
+    cache = DynamicCache()
+    with torch.no_grad():
+        model(input_ids=ids, past_key_values=cache, use_cache=True)
+    PREFIX_CACHE_STATS["prefix_tokens"] = ids.shape[1]
+    return ids, cache
+
+
+def _load_options():
+    if HF_INFERENCE_MODE == "gpu":
+        return {"dtype": torch.float16, "device_map": "auto"}   # 🔥 use dtype instead of torch_dtype
+    if HF_INFERENCE_MODE not in ("cpu", "cpu-int8"):
+        raise ValueError(f"Unknown HF_INFERENCE_MODE: {HF_INFERENCE_MODE}")
+
+    # float16 matmuls are slow or unsupported on most CPUs, and dynamic
+    # quantization starts from float32 weights. The worker runs one generate
+    # at a time, so inter-op parallelism buys nothing.
+    if HF_CPU_THREADS > 0:
+        torch.set_num_threads(HF_CPU_THREADS)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already set once parallel work has started
+    return {"dtype": torch.float32, "device_map": "cpu"}
+
+
+def load_model():
+    """Load processor and weights, recording how long each phase took.
+
+    Weights come from the safetensors files with low_cpu_mem_usage, which
+    avoids a second full copy while loading and is faster than pickled
+    .bin files. Every mode still ends up with private weights per process,
+    though: gpu copies them to the device, cpu upcasts the float16 shards
+    to float32 and cpu-int8 quantizes them. Workers on one host do not
+    share weight memory, so budget RAM (or VRAM) per worker.
+    """
+    global processor, model, text_prompt, prefix_ids, prefix_cache
+    if _model_ready.is_set():
+        return
+
+    STARTUP_REPORT["state"] = "loading"
+    started = time.perf_counter()
+    try:
+        processor = _timed("processor", lambda: AutoProcessor.from_pretrained(HF_MODEL_ID))
+        # Decoder-only generation needs the padding on the left so every row
+        # continues straight from its own prompt
+        processor.tokenizer.padding_side = "left"
+
+        model = _timed("weights", lambda: LlavaForConditionalGeneration.from_pretrained(
+            HF_MODEL_ID,
+            use_safetensors=True,
+            low_cpu_mem_usage=True,
+            **_load_options(),
+        ))
+        model.eval()
+        if HF_INFERENCE_MODE == "cpu-int8":
+            model = _timed("quantize", lambda: torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            ))
+
+        text_prompt = build_text_prompt()
+        if HF_PREFIX_CACHE:
+            prefix_ids, prefix_cache = _timed("prefix_cache", build_prefix_cache)
+    except Exception as e:
+        STARTUP_REPORT["state"] = "failed"
+        STARTUP_REPORT["error"] = str(e)
+        log_event("local_model_load_failed", model=HF_MODEL_ID, error=str(e))
+        raise
+
+    STARTUP_REPORT["phases"]["total"] = round(time.perf_counter() - started, 3)
+    STARTUP_REPORT["state"] = "ready"
+    log_event("local_model_ready", model=HF_MODEL_ID, mode=HF_INFERENCE_MODE, phases=STARTUP_REPORT["phases"])
+    _model_ready.set()
+
+
+def is_ready():
+    return _model_ready.is_set()
+
+
+# -----------------------------
+# Batched Generation
+# -----------------------------
+_decoder = json.JSONDecoder()
+
+
+def json_complete(text):
+    """True once text holds a complete JSON object/array starting at its
+    first '{' or '['. Leading prose is fine; trailing chatter is what the
+    stopping criterion saves us from generating."""
+    starts = [index for index in (text.find("{"), text.find("[")) if index >= 0]
+    if not starts:
+        return False
+    try:
+        value, _ = _decoder.raw_decode(text, min(starts))
+    except ValueError:
+        return False
+    return isinstance(value, (dict, list))
+
+
+class StopRows(StoppingCriteria):
+    """Finish each row independently once its new text is complete JSON
+    (HF_STOP_ON_JSON) or its caller has gone away."""
+
+    def __init__(self, prompt_length, is_cancelled=None):
+        self.prompt_length = prompt_length
+        self.is_cancelled = is_cancelled
+        self.finished = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.finished is None:
+            self.finished = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        for row in range(input_ids.shape[0]):
+            if self.finished[row]:
+                continue
+            if self.is_cancelled is not None and self.is_cancelled[row]():
+                GENERATION_STATS["cancelled"] += 1
+                self.finished[row] = True
+            elif HF_STOP_ON_JSON and int(input_ids[row, -1]) in _closing_token_ids():
+                text = processor.tokenizer.decode(input_ids[row, self.prompt_length:], skip_special_tokens=True)
+                if json_complete(text):
+                    GENERATION_STATS["stopped_on_json"] += 1
+                    self.finished[row] = True
+        return self.finished.clone()
+
+
+_closing_ids = None
+
+
+def _closing_token_ids():
+    """Ids of every vocabulary token containing '}' or ']'; only after one
+    of these can the JSON have just closed, so other steps skip the decode."""
+    global _closing_ids
+    if _closing_ids is None:
+        vocab = processor.tokenizer.get_vocab()
+        _closing_ids = {index for token, index in vocab.items() if "}" in token or "]" in token}
+    return _closing_ids
+
+
+def generate_batch(images, streamer=None, is_cancelled=None):
+    """Run one padded processor/generate call over PIL images and return
+    the generated text for each, in order (prompt tokens stripped).
+
+    streamer receives the text as it is generated (batch of one only);
+    is_cancelled holds one callable per row that says whether the caller
+    has given up, so its row can stop early.
+    """
+    inputs = processor(
+        images=images,
+        text=[text_prompt] * len(images),
+        padding=True,
+        return_tensors="pt"
+    ).to(model.device)
+
+    with torch.no_grad():
+        cache = _prefilled_cache(inputs)
+        if cache is None:
+            generate_inputs = dict(inputs)
+        else:
+            # Everything but the last prompt token is already in the cache,
+            # including the image, so generate only needs the token ids
+            generate_inputs = {"input_ids": inputs["input_ids"], "attention_mask": inputs["attention_mask"]}
+        prompt_length = inputs["input_ids"].shape[1]
+        output = model.generate(
+            **generate_inputs,
+            past_key_values=cache,
+            max_new_tokens=HF_MAX_NEW_TOKENS,
+            temperature=0.2,
+            stopping_criteria=StoppingCriteriaList([StopRows(prompt_length, is_cancelled)]),
+            streamer=streamer,
+        )
+
+    GENERATION_STATS["rows"] += len(images)
+    new_tokens = output[:, prompt_length:]
+    pad_token_id = processor.tokenizer.pad_token_id
+    if pad_token_id is None:
+        GENERATION_STATS["new_tokens"] += new_tokens.shape[0] * new_tokens.shape[1]
+    else:
+        # rows that stopped early are padded out to the longest one
+        GENERATION_STATS["new_tokens"] += int((new_tokens != pad_token_id).sum())
+    return processor.batch_decode(output[:, prompt_length:], skip_special_tokens=True)
+
+
+def _prefilled_cache(inputs):
+    """Extend a copy of the prefix cache over the rest of the prompt
+    (image tokens included) except its last token, or return None when the
+    batch does not start with the cached prefix (e.g. a row is padded)."""
+    if prefix_cache is None:
+        return None
+
+    input_ids = inputs["input_ids"]
+    batch_size, length = input_ids.shape
+    prefix_length = prefix_ids.shape[1]
+    if (
+        length <= prefix_length + 1
+        or not bool(inputs["attention_mask"].all())
+        or not torch.equal(input_ids[:, :prefix_length], prefix_ids.expand(batch_size, -1))
+    ):
+        PREFIX_CACHE_STATS["fallbacks"] += 1
+        return None
+
+    cache = copy.deepcopy(prefix_cache)
+    if batch_size > 1:
+        cache.batch_repeat_interleave(batch_size)
+    model(
+        input_ids=input_ids[:, prefix_length:-1],
+        pixel_values=inputs["pixel_values"],
+        attention_mask=inputs["attention_mask"][:, :-1],
+        past_key_values=cache,
+        cache_position=torch.arange(prefix_length, length - 1, device=input_ids.device),
+        use_cache=True,
+    )
+    PREFIX_CACHE_STATS["batches"] += 1
+    PREFIX_CACHE_STATS["tokens_skipped"] += prefix_length * batch_size
+    return cache
+
+
+# -----------------------------
+# Inference Worker
+# -----------------------------
+class QueueFull(Exception):
+    """The inference queue is at HF_QUEUE_SIZE; the caller should back off."""
+
+
+class ModelNotReady(Exception):
+    """The model is still loading (or failed to load)."""
+
+
+class InferenceJob:
+    def __init__(self, image, loop, streamer=None):
+        self.image = image
+        self.loop = loop
+        self.future = loop.create_future()
+        self.streamer = streamer
+        self.enqueued = time.monotonic()
+
+
+class InferenceWorker:
+    """A dedicated thread that owns the model and serves a bounded queue.
+
+    The thread first loads the model (load_model); until that finishes
+    submit() raises ModelNotReady. After that submit() enqueues an image
+    without blocking and awaits its output; it raises QueueFull right away
+    when HF_QUEUE_SIZE requests are already waiting. The worker takes the
+    first waiting request, keeps gathering for up to HF_BATCH_WINDOW_MS or
+    until HF_MAX_BATCH_SIZE requests are in hand, runs them as one batch
+    and hands each result back to the event loop, which stays free for
+    other requests in the meantime. Streaming requests always run alone.
+    """
+
+    def __init__(self, max_batch_size=HF_MAX_BATCH_SIZE, window_ms=HF_BATCH_WINDOW_MS, queue_size=HF_QUEUE_SIZE):
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = window_ms / 1000.0
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.held = None  # streaming job pulled while gathering a batch
+        self.thread = None
+        self.batches = 0
+        self.requests = 0
+        self.rejected = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_generate = 0.0
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="hf-inference", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None and is_ready():
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+        self.thread = None
+
+    def _ensure_ready(self):
+        if not is_ready():
+            self.start()  # lazy loading: the first request kicks it off
+            raise ModelNotReady()
+
+    def _enqueue(self, job):
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            self.rejected += 1
+            raise QueueFull()
+
+    async def submit(self, image):
+        self._ensure_ready()
+        job = InferenceJob(image, asyncio.get_running_loop())
+        self._enqueue(job)
+        return await job.future
+
+    def submit_stream(self, image):
+        """Queue a streaming job and return (streamer, future): iterate the
+        streamer with async for to get text as it is generated; the future
+        resolves to the full output. Cancel the future to stop generation."""
+        self._ensure_ready()
+        job = InferenceJob(
+            image,
+            asyncio.get_running_loop(),
+            AsyncTextIteratorStreamer(processor.tokenizer, skip_prompt=True, skip_special_tokens=True),
+        )
+        self._enqueue(job)
+        return job.streamer, job.future
+
+    def _next_batch(self):
+        first, self.held = self.held or self.queue.get(), None
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while first.streamer is None and len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if job is None:
+                self.queue.put(None)  # finish this batch, stop on the next
+                break
+            if job.streamer is not None:
+                self.held = job  # runs on its own next
+                break
+            batch.append(job)
+        # Callers that gave up while waiting do not take a batch slot
+        return [job for job in batch if not job.future.cancelled()]
+
+    def _run(self):
+        try:
+            load_model()
+        except Exception:
+            self.thread = None  # let the next request retry the load
+            return
+
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            if not batch:
+                continue
+
+            started = time.monotonic()
+            for job in batch:
+                wait = started - job.enqueued
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+
+            try:
+                outputs = generate_batch(
+                    [job.image for job in batch],
+                    streamer=batch[0].streamer,
+                    is_cancelled=[job.future.cancelled for job in batch],
+                )
+            except Exception as e:
+                self.failed += len(batch)
+                for job in batch:
+                    if job.streamer is not None:
+                        job.streamer.end()
+                    job.loop.call_soon_threadsafe(_resolve, job.future, None, e)
+                continue
+
+            self.total_generate += time.monotonic() - started
+            self.batches += 1
+            self.requests += len(batch)
+            for job, output in zip(batch, outputs):
+                job.loop.call_soon_threadsafe(_resolve, job.future, output, None)
+
+    def snapshot(self):
+        served = self.requests + self.failed
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window * 1000,
+            "batches": self.batches,
+            "requests": self.requests,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "mean_batch_size": round(self.requests / self.batches, 2) if self.batches else None,
+            "mean_wait_seconds": round(self.total_wait / served, 3) if served else None,
+            "max_wait_seconds": round(self.max_wait, 3),
+            "mean_generate_seconds": round(self.total_generate / self.batches, 3) if self.batches else None,
+        }
+
+
+def _resolve(future, result, error):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+worker = InferenceWorker()
+
+
+# -----------------------------
+# Image Decoding
+# -----------------------------
+# Decoding runs on its own small pool so it never competes with the
+# event loop or waits behind generate
+_decode_executor = ThreadPoolExecutor(max_workers=HF_DECODE_WORKERS, thread_name_prefix="hf-decode")
+
+
+def _decode(image_bytes):
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        return image.convert("RGB")
+
+
+async def decode_image(image_bytes):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_decode_executor, _decode, image_bytes)
+
+
+def shutdown_decoder():
+    _decode_executor.shutdown(wait=False, cancel_futures=True)
+
+
+# -----------------------------
+# Provider Chain Adapter
+# -----------------------------
+async def call_local(images, prompt):
+    """Entry point for PROVIDER_CHAIN=...,hf in app.py: every request
+    image goes through the batcher and the answers are merged, with each
+    box pointed at the image it came from. The local model has its own
+    prompt, so the chain's is ignored. Returns None while the model is
+    still loading or the queue is full, so the chain moves on."""
+    try:
+        decoded = await asyncio.gather(*(decode_image(image.data) for image in images))
+        outputs = await asyncio.gather(*(worker.submit(image) for image in decoded))
+    except (ModelNotReady, QueueFull):
+        return None
+
+    merged = {}
+    for index, text in enumerate(outputs):
+        answer = extract_json(text, "hf")
+        for category in [answer] if isinstance(answer, dict) else answer or []:
+            if not isinstance(category, dict):
+                continue
+            conditions = [condition for condition in category.get("conditions") or [] if isinstance(condition, dict)]
+            for condition in conditions:
+                for box in condition.get("boundingBoxes") or []:
+                    if isinstance(box, dict):
+                        box["imageId"] = index
+            merged.setdefault(category.get("category") or "Other", []).extend(conditions)
+    return [{"category": name, "conditions": conditions} for name, conditions in merged.items()] or None
+
+
+def start():
+    """Startup hook for app.py: begin loading the model on the worker
+    thread right away, as this module's own app does."""
+    if HF_LOAD_ON_STARTUP:
+        worker.start()
+
+
+def shutdown():
+    worker.stop()
+    shutdown_decoder()
@@ -0,0 +1,141 @@
+import base64
+import binascii
+import hashlib
+import io
+
+# Longest data-URI header we look for the comma in ("data:image/jpeg;base64,")
+_MAX_HEADER = 128
+
+# (offset, signature, MIME type)
+_SIGNATURES = [
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),  # after RIFF....
+    (4, b"ftypheic", "image/heic"),
+    (4, b"ftypheix", "image/heic"),
+    (4, b"ftypmif1", "image/heif"),
+    (4, b"ftypavif", "image/avif"),
+]
+
+# What the providers accept as-is; anything else must be converted first
+NATIVE_MIME_TYPES = {mime_type for _, _, mime_type in _SIGNATURES}
+
+
+class InvalidImage(ValueError):
+    """An upload that is not a decodable image; maps to a 400."""
+
+
+def sniff_mime_type(data: bytes):
+    for offset, signature, mime_type in _SIGNATURES:
+        if data[offset:offset + len(signature)] == signature:
+            if mime_type == "image/webp" and data[:4] != b"RIFF":
+                continue
+            return mime_type
+    return None
+
+
+def _pillow_mime_type(data: bytes):
+    """MIME type of any other format Pillow can open (BMP, TIFF, ...)."""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return Image.MIME.get(image.format)
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+
+
+# -----------------------------
+# Image Payload
+# -----------------------------
+class ImagePayload:
+    """One uploaded image, decoded and validated exactly once.
+
+    Keeps the raw bytes plus the base64 text they came from, so every
+    provider part built from it (on every failover attempt) reuses the
+    same string instead of splitting and copying the data URI again.
+    """
+
+    __slots__ = ("data", "mime_type", "size", "digest", "_base64")
+
+    def __init__(self, data: bytes, mime_type: str, base64_text: str = None):
+        self.data = data
+        self.mime_type = mime_type
+        self.size = len(data)
+        self.digest = hashlib.sha256(data).digest()
+        self._base64 = base64_text
+
+    @classmethod
+    def from_data_uri(cls, value: str, convertible=False):
+        """Parse 'data:<mime>;base64,<body>' (or bare base64). Only the
+        header is scanned for the comma; the body is sliced out once.
+        Line-wrapped (MIME-style) base64 is accepted."""
+        if not isinstance(value, str) or not value:
+            raise InvalidImage("Image must be a non-empty base64 string")
+
+        body = value
+        if value.startswith("data:"):
+            comma = value.find(",", 0, _MAX_HEADER)
+            if comma < 0 or ";base64" not in value[:comma]:
+                raise InvalidImage("Image data URI must be base64 encoded")
+            body = value[comma + 1:]
+        if any(char in body for char in "\r\n \t"):
+            body = "".join(body.split())
+
+        try:
+            data = base64.b64decode(body, validate=True)
+        except (binascii.Error, ValueError):
+            raise InvalidImage("Image is not valid base64")
+        return cls.from_bytes(data, base64_text=body, convertible=convertible)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, base64_text: str = None, convertible=False):
+        """Wrap raw image bytes; the MIME type comes from the magic bytes,
+        never from what the client declared.
+
+        convertible: also accept formats Pillow can open (BMP, TIFF, ...),
+        for when normalization will re-encode them before dispatch.
+        """
+        mime_type = sniff_mime_type(data)
+        if mime_type is None and convertible:
+            mime_type = _pillow_mime_type(data)
+        if mime_type is None:
+            expected = "JPEG, PNG, WebP, GIF, HEIC, AVIF or another format Pillow reads" if convertible else "JPEG, PNG, WebP, GIF, HEIC or AVIF"
+            raise InvalidImage(f"Unsupported or corrupt image (expected {expected})")
+        return cls(data, mime_type, base64_text)
+
+    @property
+    def sha256(self):
+        return self.digest.hex()
+
+    @property
+    def base64(self):
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode("ascii")
+        return self._base64
+
+    def data_uri(self):
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+    # -----------------------------
+    # Provider Parts
+    # -----------------------------
+    def gemini_part(self):
+        return {"inline_data": {"mime_type": self.mime_type, "data": self.base64}}
+
+    def openai_part(self):
+        return {"type": "input_image", "image_base64": self.base64}
+
+
+def parse_images(images, convertible=False):
+    """Data URIs from a request -> ImagePayloads. Raises InvalidImage
+    naming the first bad image."""
+    payloads = []
+    for index, image in enumerate(images):
+        try:
+            payloads.append(ImagePayload.from_data_uri(image, convertible))
+        except InvalidImage as e:
+            raise InvalidImage(f"images[{index}]: {e}")
+    return payloads
@@ -0,0 +1,267 @@
+import asyncio
+import io
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from image_payload import ImagePayload
+from metrics import log_event
+
+IMAGE_NORMALIZE = os.getenv("IMAGE_NORMALIZE", "true").lower() in ("1", "true", "yes")
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1536"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()  # JPEG or WEBP
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "4"))
+# Drop near-identical frames (e.g. a camera burst) before dispatch
+IMAGE_DEDUP = os.getenv("IMAGE_DEDUP", "true").lower() in ("1", "true", "yes")
+# Max differing bits (of 64) between perceptual hashes for two images to count as duplicates
+IMAGE_DEDUP_MAX_DISTANCE = int(os.getenv("IMAGE_DEDUP_MAX_DISTANCE", "6"))
+
+# Pillow releases the GIL while decoding, resizing and encoding
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+
+_EXIF_ORIENTATION = 0x0112
+
+# Metadata that can identify the patient or device: APP1 (EXIF, incl. GPS,
+# and XMP), APP13 (IPTC / Photoshop) and comments. APP0, the ICC profile in
+# APP2 and Adobe's APP14 only describe how to decode the pixels.
+_JPEG_METADATA_MARKERS = {0xE1, 0xED, 0xFE}
+_PNG_METADATA_CHUNKS = {b"eXIf", b"tEXt", b"zTXt", b"iTXt", b"tIME"}
+
+
+# -----------------------------
+# Perceptual Hash
+# -----------------------------
+_HASH_SAMPLE = 32  # side of the grayscale thumbnail the DCT runs on
+_HASH_SIDE = 8     # low-frequency block kept -> 64-bit hash
+
+
+def _dct_matrix(n):
+    """Orthonormal DCT-II basis; D @ X @ D.T is the 2-D DCT of X."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+# Only the low-frequency rows are ever needed
+_DCT = _dct_matrix(_HASH_SAMPLE)[:_HASH_SIDE].astype(np.float32)
+
+
+def perceptual_hash(image):
+    """64-bit pHash as a bool array: the 8x8 lowest DCT frequencies of a
+    32x32 grayscale thumbnail, thresholded at their median (DC excluded).
+    Robust to re-encoding, small exposure changes and tiny shifts."""
+    sample = image.convert("L").resize((_HASH_SAMPLE, _HASH_SAMPLE), Image.Resampling.BILINEAR)
+    pixels = np.asarray(sample, dtype=np.float32)
+    low = (_DCT @ pixels @ _DCT.T).ravel()
+    return low > np.median(low[1:])
+
+
+def hamming_distances(hashes):
+    """Pairwise differing bits for an (N, 64) bool array -> (N, N)."""
+    return np.count_nonzero(hashes[:, None, :] != hashes[None, :, :], axis=-1)
+
+
+# -----------------------------
+# Metadata Stripping
+# -----------------------------
+def _strip_jpeg(data):
+    output = [data[:2]]  # SOI
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF:  # fill byte
+            position += 1
+            continue
+        if marker == 0xDA:  # start of scan: entropy-coded data to the end
+            output.append(data[position:])
+            return b"".join(output)
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            output.append(data[position:position + 2])
+            position += 2
+            continue
+        end = position + 2 + struct.unpack(">H", data[position + 2:position + 4])[0]
+        if end > len(data):
+            return None
+        if marker not in _JPEG_METADATA_MARKERS:
+            output.append(data[position:end])
+        position = end
+    return None
+
+
+def _strip_png(data):
+    output = [data[:8]]  # signature
+    position = 8
+    while position + 12 <= len(data):
+        length = struct.unpack(">I", data[position:position + 4])[0]
+        chunk_type = data[position + 4:position + 8]
+        end = position + 12 + length
+        if end > len(data):
+            return None
+        if chunk_type not in _PNG_METADATA_CHUNKS:
+            output.append(data[position:end])
+        position = end
+        if chunk_type == b"IEND":
+            return b"".join(output)
+    return None
+
+
+def strip_metadata(payload: ImagePayload):
+    """The same image without identifying metadata, byte-for-byte
+    otherwise (no recompression), or None for formats this cannot do
+    losslessly or files it cannot walk."""
+    if payload.mime_type == "image/jpeg":
+        stripped = _strip_jpeg(payload.data)
+    elif payload.mime_type == "image/png":
+        stripped = _strip_png(payload.data)
+    else:
+        return None
+    if stripped is None:
+        return None
+    return payload if len(stripped) == payload.size else ImagePayload.from_bytes(stripped)
+
+
+# -----------------------------
+# Single Image
+# -----------------------------
+def normalize_image(payload: ImagePayload):
+    """Apply the image's EXIF orientation, cap the longest side at
+    IMAGE_MAX_SIDE and re-encode without metadata.
+
+    Only uniform scaling is applied, so the normalized bounding boxes the
+    model returns still line up with the photo the client displays. An
+    image that needed neither rotation nor downscaling is kept, with its
+    metadata stripped losslessly, unless re-encoding makes it smaller, so
+    small JPEGs are not inflated or put through another round of
+    compression. Formats whose metadata cannot be stripped that way are
+    always re-encoded, so no EXIF (GPS, device) reaches a provider.
+    Returns (payload, original_bytes, normalized_bytes, phash).
+    """
+    with Image.open(io.BytesIO(payload.data)) as image:
+        rotated = image.getexif().get(_EXIF_ORIENTATION, 1) != 1
+        original_size = image.size
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE), Image.Resampling.LANCZOS)
+        phash = perceptual_hash(image) if IMAGE_DEDUP else None
+        resized = image.size != original_size
+
+        output = io.BytesIO()
+        image.save(output, format=IMAGE_FORMAT, quality=IMAGE_QUALITY, optimize=True)
+
+    if not rotated and not resized:
+        stripped = strip_metadata(payload)
+        if stripped is not None and output.tell() >= stripped.size:
+            return stripped, payload.size, stripped.size, phash
+    normalized = ImagePayload.from_bytes(output.getvalue())
+    return normalized, payload.size, normalized.size, phash
+
+
+def hash_image(payload: ImagePayload):
+    """Decode only to hash, for when normalization is turned off."""
+    with Image.open(io.BytesIO(payload.data)) as image:
+        return payload, 0, 0, perceptual_hash(ImageOps.exif_transpose(image))
+
+
+def _prepare(payload: ImagePayload):
+    try:
+        if IMAGE_NORMALIZE:
+            return normalize_image(payload)
+        return hash_image(payload)
+    except Exception as e:
+        # Formats Pillow cannot read (e.g. HEIC without a plugin) are forwarded
+        # untouched and never treated as duplicates
+        log_event("image_normalization_skipped", mime_type=payload.mime_type, error=str(e))
+        return payload, 0, 0, None
+
+
+# -----------------------------
+# Request Stage
+# -----------------------------
+async def normalize_images(images):
+    """Normalize (and, with IMAGE_DEDUP, hash) every image of a request
+    in parallel. Returns (images, bytes_saved, hashes); a hash is None for
+    images that could not be decoded."""
+    if not IMAGE_NORMALIZE and not (IMAGE_DEDUP and len(images) > 1):
+        return images, 0, [None] * len(images)
+
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(
+        loop.run_in_executor(_executor, _prepare, image)
+        for image in images
+    ))
+
+    normalized = [payload for payload, _, _, _ in results]
+    # A rotated image can come out a little larger; that is not a saving to report
+    bytes_saved = sum(max(0, before - after) for _, before, after, _ in results)
+    hashes = [phash for _, _, _, phash in results]
+    return normalized, bytes_saved, hashes
+
+
+def dedupe_images(images, hashes, max_distance=IMAGE_DEDUP_MAX_DISTANCE):
+    """Keep the first of every run of near-identical images.
+
+    An image is dropped when its hash is within max_distance bits of an
+    image already kept. Returns (kept, groups): groups[k] lists the request
+    indices kept image k stands for, its own index first.
+    """
+    groups = []
+    hashed = [index for index, phash in enumerate(hashes) if phash is not None]
+    if not IMAGE_DEDUP or len(hashed) < 2:
+        return images, [[index] for index in range(len(images))]
+
+    position = {index: row for row, index in enumerate(hashed)}
+    distances = hamming_distances(np.stack([hashes[index] for index in hashed]))
+
+    kept_rows = []   # distance-matrix rows of kept, hashed images
+    kept_groups = []  # group of each of those rows
+    for index in range(len(images)):
+        row = position.get(index)
+        if row is not None and kept_rows:
+            matches = np.flatnonzero(distances[row, kept_rows] <= max_distance)
+            if matches.size:
+                kept_groups[matches[0]].append(index)
+                continue
+        group = [index]
+        groups.append(group)
+        if row is not None:
+            kept_rows.append(row)
+            kept_groups.append(group)
+
+    return [images[group[0]] for group in groups], groups
+
+
+def expand_image_ids(result, groups):
+    """Map boundingBoxes[].imageId from the deduplicated list back to the
+    request's images, copying each box onto the duplicates that were
+    dropped so every submitted frame keeps its overlay."""
+    if all(len(group) == 1 for group in groups):
+        return result
+
+    for category in result if isinstance(result, list) else [result]:
+        if not isinstance(category, dict):
+            continue
+        for condition in category.get("conditions") or []:
+            if not isinstance(condition, dict) or not isinstance(condition.get("boundingBoxes"), list):
+                continue
+            boxes = []
+            for box in condition["boundingBoxes"]:
+                image_id = box.get("imageId") if isinstance(box, dict) else None
+                if not isinstance(image_id, (int, float)) or image_id != int(image_id) or not 0 <= image_id < len(groups):
+                    boxes.append(box)
+                    continue
+                boxes.extend({**box, "imageId": index} for index in groups[int(image_id)])
+            condition["boundingBoxes"] = boxes
+    return result
+
+
+def shutdown_executor():
+    _executor.shutdown(wait=False, cancel_futures=True)
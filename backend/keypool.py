@@ -0,0 +1,136 @@
+import os
+import re
+import time
+from email.utils import parsedate_to_datetime
+
+from ratelimit import TokenBucket
+
+# Cool-down applied to a rate-limited key when the provider gives no hint
+KEY_COOLDOWN_SECONDS = float(os.getenv("KEY_COOLDOWN_SECONDS", "60"))
+# Cool-down for keys the provider rejects outright (invalid / revoked)
+KEY_REJECTED_COOLDOWN_SECONDS = float(os.getenv("KEY_REJECTED_COOLDOWN_SECONDS", "3600"))
+
+
+def parse_keys(*env_names):
+    """Read comma-separated keys from the first non-empty variable,
+    the same convention frontend/server.js uses for GEMINI_API_KEY."""
+    for env_name in env_names:
+        raw = os.getenv(env_name)
+        if raw:
+            return [key.strip() for key in raw.split(",") if key.strip()]
+    return []
+
+
+# -----------------------------
+# Rate-Limit Hints
+# -----------------------------
+def retry_after_seconds(response):
+    """Best-effort wait hint from a 429/503 response: Retry-After (seconds
+    or HTTP date), X-RateLimit-Reset (epoch seconds or ms) or Gemini's
+    RetryInfo.retryDelay in the error body."""
+    header = response.headers.get("retry-after")
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(header).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    reset = response.headers.get("x-ratelimit-reset")
+    if reset:
+        try:
+            reset_at = float(reset)
+            if reset_at > 1e12:  # milliseconds
+                reset_at /= 1000
+            if reset_at > 1e9:
+                return max(0.0, reset_at - time.time())
+            return max(0.0, reset_at)
+        except ValueError:
+            pass
+
+    match = re.search(r'"retryDelay"\s*:\s*"([\d.]+)s"', response.text or "")
+    if match:
+        return float(match.group(1))
+
+    return None
+
+
+# -----------------------------
+# Key Pool
+# -----------------------------
+class ApiKey:
+    def __init__(self, value, rate_per_minute):
+        self.value = value
+        self.bucket = TokenBucket(rate_per_minute)
+        self.cooldown_until = 0.0
+        self.last_used = 0.0
+        self.requests = 0
+        self.rate_limited = 0
+
+    def capacity(self):
+        available = self.bucket.available()
+        return float("inf") if available is None else available
+
+
+class KeyPool:
+    """All API keys of one provider, each with its own token bucket.
+
+    acquire() hands out the key with the most remaining capacity (least
+    recently used on ties), skipping keys that are cooling down after a
+    429. It returns None when every key is exhausted so the caller can fall
+    back to the next provider instead of waiting.
+    """
+
+    def __init__(self, name, keys, rate_per_minute=0):
+        self.name = name
+        self.keys = [ApiKey(key, rate_per_minute) for key in keys]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def acquire(self):
+        now = time.monotonic()
+        candidates = sorted(
+            (key for key in self.keys if key.cooldown_until <= now),
+            key=lambda key: (-key.capacity(), key.last_used),
+        )
+        for key in candidates:
+            if key.bucket.try_acquire():
+                key.last_used = now
+                key.requests += 1
+                return key
+        return None
+
+    def cool_down(self, key, seconds=None):
+        key.rate_limited += 1
+        key.cooldown_until = time.monotonic() + (KEY_COOLDOWN_SECONDS if seconds is None else seconds)
+
+    def snapshot(self):
+        now = time.monotonic()
+        return [
+            {
+                "key": f"...{key.value[-4:]}",
+                "cooling_down_seconds": round(max(0.0, key.cooldown_until - now), 1),
+                "tokens_available": key.bucket.available(),
+                "requests": key.requests,
+                "rate_limited": key.rate_limited,
+            }
+            for key in self.keys
+        ]
+
+
+def _key_rpm(name):
+    return int(os.getenv(f"{name.upper()}_KEY_RPM", "0"))
+
+
+KEY_POOLS = {
+    "gemini": KeyPool("gemini", parse_keys("GOOGLE_API_KEY", "GEMINI_API_KEY"), _key_rpm("gemini")),
+    "openrouter": KeyPool("openrouter", parse_keys("OPENROUTER_API_KEY"), _key_rpm("openrouter")),
+    "groq": KeyPool("groq", parse_keys("GROQ_API_KEY"), _key_rpm("groq")),
+}
+
+
+def key_pool_snapshot():
+    return {name: pool.snapshot() for name, pool in KEY_POOLS.items()}
@@ -0,0 +1,185 @@
+import asyncio
+import contextvars
+import json
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Set per request by the middleware in app.py; copied into every task the
+# request spawns, so provider attempts log under the same id
+REQUEST_ID = contextvars.ContextVar("request_id", default=None)
+REQUEST_STAGES = contextvars.ContextVar("request_stages", default=None)
+REQUEST_STARTED = contextvars.ContextVar("request_started", default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+BYTES_BUCKETS = tuple(16 * 1024 * 4 ** power for power in range(8))  # 16 KiB .. 256 MiB
+
+
+# -----------------------------
+# Metric Types
+# -----------------------------
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = defaultdict(float)
+
+    def inc(self, amount=1, **labels):
+        self.values[tuple(sorted(labels.items()))] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_label_text(labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [0] * len(self.buckets) + [0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_label_text(labels + (('le', f'{bound:g}'),))} {count}")
+            lines.append(f"{self.name}_bucket{_label_text(labels + (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_label_text(labels)} {series[-2]:g}")
+            lines.append(f"{self.name}_count{_label_text(labels)} {series[-1]}")
+        return lines
+
+
+# -----------------------------
+# Service Metrics
+# -----------------------------
+HTTP_REQUEST_SECONDS = Histogram("http_request_seconds", "Time to response headers by route and status.")
+STAGE_SECONDS = Histogram("analysis_stage_seconds", "Time spent in each analysis stage.")
+PROVIDER_SECONDS = Histogram("provider_attempt_seconds", "Upstream provider attempts by outcome.")
+PROVIDER_FAILOVERS = Counter("provider_failovers_total", "Requests served by a provider other than the first tried.")
+PARSE_RESULTS = Counter("parse_results_total", "Model output parse outcomes by provider.")
+PAYLOAD_BYTES = Histogram("analysis_payload_bytes", "Decoded image bytes per analysis request.", BYTES_BUCKETS)
+IMAGE_BYTES_SAVED = Counter("image_bytes_saved_total", "Bytes removed from uploads by image normalization.")
+IMAGES_DEDUPLICATED = Counter("images_deduplicated_total", "Near-duplicate images dropped before dispatch.")
+CACHE_RESULTS = Counter("analysis_cache_total", "Analysis cache lookups by outcome.")
+COALESCED_REQUESTS = Counter("analysis_coalesced_total", "Analysis requests that shared an identical in-flight upstream call.")
+
+REGISTRY = [
+    HTTP_REQUEST_SECONDS,
+    STAGE_SECONDS,
+    PROVIDER_SECONDS,
+    PROVIDER_FAILOVERS,
+    PARSE_RESULTS,
+    PAYLOAD_BYTES,
+    IMAGE_BYTES_SAVED,
+    IMAGES_DEDUPLICATED,
+    CACHE_RESULTS,
+    COALESCED_REQUESTS,
+]
+
+
+def render_metrics():
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# -----------------------------
+# Structured Logs
+# -----------------------------
+def log_event(event, **fields):
+    """One JSON line per event, tagged with the current request id."""
+    record = {"ts": round(time.time(), 3), "event": event}
+    request_id = REQUEST_ID.get()
+    if request_id:
+        record["request_id"] = request_id
+    record.update(fields)
+    print(json.dumps(record, default=str))
+
+
+def new_request_id(incoming=None):
+    return incoming or uuid.uuid4().hex[:16]
+
+
+# -----------------------------
+# Timing Spans
+# -----------------------------
+def _add_to_request(stage, seconds):
+    stages = REQUEST_STAGES.get()
+    if stages is not None:
+        stages[stage] = round(stages.get(stage, 0) + seconds * 1000, 1)
+
+
+def record_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    _add_to_request(stage, seconds)
+
+
+@contextmanager
+def span(stage):
+    """Time a block as one analysis stage (histogram + the request's log
+    line). Stages can nest: parse time is also part of its provider attempt."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def since_request_start():
+    started = REQUEST_STARTED.get()
+    return 0.0 if started is None else time.perf_counter() - started
+
+
+@contextmanager
+def provider_attempt(name, **fields):
+    """Time, count and log one provider attempt. The block sets
+    attempt["outcome"] to "success" when it got a usable answer; an
+    exception counts as "cancelled" (the caller gave up) or "error"."""
+    log_event("provider_attempt", provider=name, **fields)
+    started = time.perf_counter()
+    attempt = {"outcome": "failure"}
+    try:
+        yield attempt
+    except BaseException as e:
+        attempt["outcome"] = "cancelled" if isinstance(e, (asyncio.CancelledError, GeneratorExit)) else "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        PROVIDER_SECONDS.observe(elapsed, provider=name, outcome=attempt["outcome"])
+        _add_to_request(f"provider:{name}", elapsed)
+        log_event("provider_result", provider=name, outcome=attempt["outcome"], duration_ms=round(elapsed * 1000, 1), **fields)
+
+
+def instrument_provider(name, call):
+    """Wrap a provider call so every attempt is timed, counted and logged."""
+    async def instrumented(images, prompt):
+        with provider_attempt(name) as attempt:
+            result = await call(images, prompt)
+            if result:
+                attempt["outcome"] = "success"
+            return result
+
+    return instrumented
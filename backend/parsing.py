@@ -0,0 +1,210 @@
+import json
+import re
+from collections import defaultdict
+
+from metrics import log_event, span, PARSE_RESULTS
+
+# -----------------------------
+# Response Schema
+# -----------------------------
+# Mirrors SkinConditionCategory[] in frontend/types.ts
+BOUNDING_BOX_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "imageId": {"type": "number"},
+        "box": {
+            "type": "object",
+            "properties": {
+                "x1": {"type": "number"},
+                "y1": {"type": "number"},
+                "x2": {"type": "number"},
+                "y2": {"type": "number"},
+            },
+            "required": ["x1", "y1", "x2", "y2"],
+        },
+    },
+    "required": ["imageId", "box"],
+}
+
+SKIN_CONDITION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "confidence": {"type": "number"},
+        "location": {"type": "string"},
+        "description": {"type": "string"},
+        "boundingBoxes": {"type": "array", "items": BOUNDING_BOX_SCHEMA},
+    },
+    "required": ["name", "confidence", "location", "description", "boundingBoxes"],
+}
+
+SKIN_ANALYSIS_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "category": {"type": "string"},
+            "conditions": {"type": "array", "items": SKIN_CONDITION_SCHEMA},
+        },
+        "required": ["category", "conditions"],
+    },
+}
+
+
+def to_gemini_schema(schema):
+    """Gemini's responseSchema is an OpenAPI subset with upper-case types."""
+    converted = {}
+    for key, value in schema.items():
+        if key == "type":
+            converted[key] = value.upper()
+        elif key == "properties":
+            converted[key] = {name: to_gemini_schema(prop) for name, prop in value.items()}
+        elif key == "items":
+            converted[key] = to_gemini_schema(value)
+        else:
+            converted[key] = value
+    return converted
+
+
+GEMINI_RESPONSE_SCHEMA = to_gemini_schema(SKIN_ANALYSIS_SCHEMA)
+
+OPENAI_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "skin_analysis",
+        "schema": SKIN_ANALYSIS_SCHEMA,
+    },
+}
+
+
+# -----------------------------
+# Parse Outcome Counters
+# -----------------------------
+# provider -> {"clean" | "extracted" | "repaired" | "failed": count}
+PARSE_STATS = defaultdict(lambda: {"clean": 0, "extracted": 0, "repaired": 0, "failed": 0})
+
+
+def parse_stats_snapshot():
+    return {provider: dict(counts) for provider, counts in PARSE_STATS.items()}
+
+
+# -----------------------------
+# Tolerant JSON Extraction
+# -----------------------------
+_THINK_BLOCK = re.compile(r"<think>.*?</think>", re.DOTALL | re.IGNORECASE)
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_MAX_START_CANDIDATES = 20
+
+_decoder = json.JSONDecoder()
+
+
+def _strip_reasoning(text):
+    text = _THINK_BLOCK.sub("", text)
+    # An unterminated think block means everything before the close tag is reasoning
+    if "</think>" in text:
+        text = text.rsplit("</think>", 1)[1]
+    return text
+
+
+def _repair_truncated(text, start):
+    """Close a JSON document cut off mid-stream: drop the incomplete tail
+    after the last fully closed element and append the missing brackets."""
+    stack = []
+    in_string = escaped = False
+    last_safe = None  # (end offset, open brackets at that point)
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+        elif char in "}]" and stack:
+            stack.pop()
+            if not stack:
+                return None  # closed normally, so not a truncation
+            last_safe = (index + 1, list(stack))
+
+    if last_safe is None:
+        return None
+
+    end, open_brackets = last_safe
+    closing = "".join("}" if bracket == "{" else "]" for bracket in reversed(open_brackets))
+    candidate = text[start:end].rstrip().rstrip(",") + closing
+    try:
+        return json.loads(candidate)
+    except ValueError:
+        return None
+
+
+def _looks_like_answer(value):
+    # Skip things like "[1]", "[]" or "[see below]" in leading prose, and
+    # bare scalars such as 42 or "sorry" that happen to be valid JSON
+    if isinstance(value, dict):
+        return True
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+
+def _decode_from_starts(text):
+    """raw_decode from each '{' / '[' in turn, ignoring leading prose and
+    trailing garbage; if the document at a start is truncated, repair it
+    before moving on, so a cut-off array is not mistaken for its first item.
+    Returns (value, repaired) or (None, False)."""
+    starts = [index for index, char in enumerate(text) if char in "{["]
+    for start in starts[:_MAX_START_CANDIDATES]:
+        try:
+            value, _ = _decoder.raw_decode(text, start)
+        except ValueError:
+            value = _repair_truncated(text, start)
+            if _looks_like_answer(value):
+                return value, True
+            continue
+        if _looks_like_answer(value):
+            return value, False
+    return None, False
+
+
+def _extract(text):
+    """Returns (value, outcome) with outcome one of the PARSE_STATS keys."""
+    if not text:
+        return None, "failed"
+
+    try:
+        value = json.loads(text.strip())
+    except ValueError:
+        pass
+    else:
+        if _looks_like_answer(value):
+            return value, "clean"
+
+    cleaned = _strip_reasoning(text)
+    candidates = [match.group(1) for match in _FENCE.finditer(cleaned)] + [cleaned]
+    for candidate in candidates:
+        value, repaired = _decode_from_starts(candidate)
+        if value is not None:
+            return value, "repaired" if repaired else "extracted"
+    return None, "failed"
+
+
+def extract_json(text, provider="unknown"):
+    """Recover the JSON answer from raw model output.
+
+    Handles <think> reasoning, ```json fences, leading prose, trailing
+    garbage and output truncated mid-array. Returns None (and counts a
+    parse failure for the provider) when nothing usable is found.
+    """
+    with span("parse"):
+        value, outcome = _extract(text)
+
+    PARSE_STATS[provider][outcome] += 1
+    PARSE_RESULTS.inc(provider=provider, outcome=outcome)
+    if outcome == "failed" and text:
+        log_event("parse_failed", provider=provider, output=text[:200])
+    return value
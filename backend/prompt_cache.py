@@ -0,0 +1,144 @@
+import asyncio
+import os
+import time
+
+from metrics import log_event
+
+# Gemini explicit context caching of the static instructions. Off by
+# default: the current prompt (~600 tokens) is below the minimum Gemini
+# will cache, so every create would just be a failed round trip
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "false").lower() in ("1", "true", "yes")
+# Smallest prompt, in tokens, the model accepts for explicit caching (1024
+# for 2.5 Flash, more for Pro); shorter prompts are never uploaded
+GEMINI_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CACHE_MIN_TOKENS", "1024"))
+GEMINI_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CACHE_TTL_SECONDS", "3600"))
+# Extend the TTL when a handle has less than this long to live
+GEMINI_CACHE_REFRESH_SECONDS = int(os.getenv("GEMINI_CACHE_REFRESH_SECONDS", "300"))
+# After a failed create (e.g. prompt below the model's minimum cacheable size) wait this long before trying again
+GEMINI_CACHE_RETRY_SECONDS = int(os.getenv("GEMINI_CACHE_RETRY_SECONDS", "3600"))
+
+# Mark the static prompt part with cache_control on OpenRouter; providers
+# with automatic prefix caching ignore it and still reuse the prefix
+OPENROUTER_PROMPT_CACHE = os.getenv("OPENROUTER_PROMPT_CACHE", "true").lower() in ("1", "true", "yes")
+
+PROMPT_CACHE_STATS = {
+    "gemini_handles_created": 0,
+    "gemini_handles_refreshed": 0,
+    "gemini_create_failures": 0,
+    "gemini_prompt_too_small": 0,
+    "gemini_cached_requests": 0,
+    "gemini_fallbacks": 0,
+    "cached_prompt_tokens": 0,
+}
+
+
+def record_cached_tokens(count):
+    if count:
+        PROMPT_CACHE_STATS["cached_prompt_tokens"] += int(count)
+
+
+# -----------------------------
+# Gemini Cached Content Handles
+# -----------------------------
+class GeminiContextCache:
+    """Upload the static instructions once per (API key, model, prompt
+    version) as a cachedContents resource and hand out its name.
+
+    Cached content belongs to the key's project, so every pooled key gets
+    its own handle. Returns None whenever caching is off or unavailable;
+    callers then send the prompt inline.
+    """
+
+    def __init__(self):
+        self._handles = {}  # cache id -> (name, expires_at)
+        self._failed_until = {}
+        self._locks = {}
+
+    @staticmethod
+    def _cache_id(api_key, model, prompt):
+        return (api_key, model, prompt.fingerprint)
+
+    @staticmethod
+    def cacheable(prompt):
+        # ~4 characters per token; a rough estimate is enough to avoid a
+        # create that is certain to be rejected
+        return len(prompt.text) / 4 >= GEMINI_CACHE_MIN_TOKENS
+
+    async def handle(self, client, base_url, api_key, model, prompt):
+        if not GEMINI_CONTEXT_CACHE:
+            return None
+        if not self.cacheable(prompt):
+            PROMPT_CACHE_STATS["gemini_prompt_too_small"] += 1
+            return None
+
+        cache_id = self._cache_id(api_key, model, prompt)
+        if self._failed_until.get(cache_id, 0) > time.monotonic():
+            return None
+
+        lock = self._locks.setdefault(cache_id, asyncio.Lock())
+        async with lock:
+            name, expires_at = self._handles.get(cache_id, (None, 0))
+            remaining = expires_at - time.monotonic()
+            if name and remaining > GEMINI_CACHE_REFRESH_SECONDS:
+                return name
+            if name and remaining > 0 and await self._refresh(client, base_url, api_key, name):
+                self._handles[cache_id] = (name, time.monotonic() + GEMINI_CACHE_TTL_SECONDS)
+                return name
+
+            name = await self._create(client, base_url, api_key, model, prompt)
+            if name is None:
+                self._handles.pop(cache_id, None)
+                self._failed_until[cache_id] = time.monotonic() + GEMINI_CACHE_RETRY_SECONDS
+                return None
+            self._handles[cache_id] = (name, time.monotonic() + GEMINI_CACHE_TTL_SECONDS)
+            return name
+
+    async def _create(self, client, base_url, api_key, model, prompt):
+        body = {
+            "model": f"models/{model}",
+            "contents": [{"role": "user", "parts": [{"text": prompt.text}]}],
+            "ttl": f"{GEMINI_CACHE_TTL_SECONDS}s",
+            "displayName": prompt.id,
+        }
+        try:
+            response = await client.post(
+                f"{base_url}/cachedContents",
+                headers={"x-goog-api-key": api_key, "Content-Type": "application/json"},
+                json=body,
+            )
+            response.raise_for_status()
+            PROMPT_CACHE_STATS["gemini_handles_created"] += 1
+            log_event("gemini_context_cache_created", prompt=prompt.id, model=model)
+            return response.json()["name"]
+        except Exception as e:
+            PROMPT_CACHE_STATS["gemini_create_failures"] += 1
+            log_event("gemini_context_cache_unavailable", prompt=prompt.id, model=model, error=str(e))
+            return None
+
+    async def _refresh(self, client, base_url, api_key, name):
+        try:
+            response = await client.patch(
+                f"{base_url}/{name}",
+                params={"updateMask": "ttl"},
+                headers={"x-goog-api-key": api_key, "Content-Type": "application/json"},
+                json={"ttl": f"{GEMINI_CACHE_TTL_SECONDS}s"},
+            )
+            response.raise_for_status()
+            PROMPT_CACHE_STATS["gemini_handles_refreshed"] += 1
+            return True
+        except Exception as e:
+            log_event("gemini_context_cache_refresh_failed", handle=name, error=str(e))
+            return False
+
+    def invalidate(self, api_key, model, prompt):
+        self._handles.pop(self._cache_id(api_key, model, prompt), None)
+
+    def snapshot(self):
+        now = time.monotonic()
+        return {
+            **PROMPT_CACHE_STATS,
+            "gemini_active_handles": sum(1 for _, expires_at in self._handles.values() if expires_at > now),
+        }
+
+
+gemini_context_cache = GeminiContextCache()
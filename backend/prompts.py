@@ -1,58 +1,14 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Any
-import google.generativeai as genai
-import base64
+import hashlib
 import os
-import json
-
-# Configure Gemini API Key
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-
-app = FastAPI()
-
-# -----------------------------
-# Request Model
-# -----------------------------
-class AnalyzeRequest(BaseModel):
-    images: List[str]
-
-
-# -----------------------------
-# Helper: Convert Base64 to Gemini Part
-# -----------------------------
-def base64_to_part(base64_string: str):
-    try:
-        header, encoded = base64_string.split(",", 1)
-        mime_type = header.split(";")[0].split(":")[1]
-
-        return {
-            "inline_data": {
-                "mime_type": mime_type,
-                "data": encoded
-            }
-        }
-    except Exception:
-        raise ValueError("Invalid base64 image format")
-
 
 # -----------------------------
-# API Route
+# Prompt Registry
 # -----------------------------
-@app.post("/api/analyze-skin")
-async def analyze_skin(request: AnalyzeRequest):
-    try:
-        images = request.images
-
-        if not images or not isinstance(images, list):
-            raise HTTPException(
-                status_code=400,
-                detail="Please provide an array of base64 images in the 'images' field."
-            )
+# Every prompt the backend sends lives here, keyed by (name, version).
+# Add a new version instead of editing one in place: cache keys and
+# provider-side context caches are tied to the exact text.
 
-        image_parts = [base64_to_part(img) for img in images]
-
-        prompt = """
+_SKIN_ANALYSIS_V1 = """
         You are an expert dermatologist. Analyze these facial images VERY CAREFULLY and detect ALL visible skin conditions.
     
         **CRITICAL INSTRUCTIONS:**
@@ -95,22 +51,43 @@ async def analyze_skin(request: AnalyzeRequest):
         Provide output in JSON format. Do NOT return empty arrays for boundingBoxes - every condition MUST have visible boxes.
         """
 
-        model = genai.GenerativeModel("gemini-2.5-flash")
+PROMPTS = {
+    ("skin-analysis", "v1"): _SKIN_ANALYSIS_V1,
+    # The local LLaVA server adds a closing reminder to the same instructions
+    ("skin-analysis-local", "v1"): _SKIN_ANALYSIS_V1.rstrip() + """
+
+        Analyze ALL visible skin conditions carefully.
+        """,
+}
+
+# Active version per prompt name, overridable with PROMPT_VERSION_<NAME>
+DEFAULT_VERSIONS = {
+    "skin-analysis": "v1",
+    "skin-analysis-local": "v1",
+}
+
+
+class Prompt:
+    def __init__(self, name, version, text):
+        self.name = name
+        self.version = version
+        self.text = text
+        self.fingerprint = hashlib.sha256(text.encode()).hexdigest()[:16]
+
+    @property
+    def id(self):
+        return f"{self.name}/{self.version}"
 
-        response = model.generate_content(
-            contents=image_parts + [prompt],
-            generation_config={
-                "response_mime_type": "application/json"
-            }
-        )
 
-        result = json.loads(response.text.strip()) if response.text else []
+_loaded = {}
 
-        return result
 
-    except Exception as e:
-        print("Error analyzing skin:", e)
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to analyze skin: {str(e)}"
-        )
\ No newline at end of file
+def get_prompt(name, version=None):
+    """Return the Prompt for name at the configured (or given) version.
+    Prompt objects are built once and reused."""
+    if version is None:
+        env_name = "PROMPT_VERSION_" + name.upper().replace("-", "_")
+        version = os.getenv(env_name, DEFAULT_VERSIONS[name])
+    if (name, version) not in _loaded:
+        _loaded[(name, version)] = Prompt(name, version, PROMPTS[(name, version)])
+    return _loaded[(name, version)]
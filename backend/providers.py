@@ -0,0 +1,370 @@
+import json
+import os
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()  # Load environment variables from .env file
+
+from keypool import KEY_POOLS, KEY_REJECTED_COOLDOWN_SECONDS, retry_after_seconds
+from metrics import log_event
+from parsing import extract_json, GEMINI_RESPONSE_SCHEMA, OPENAI_RESPONSE_FORMAT
+from prompt_cache import (
+    gemini_context_cache,
+    record_cached_tokens,
+    OPENROUTER_PROMPT_CACHE,
+    PROMPT_CACHE_STATS,
+)
+
+# Provider endpoints
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+
+# Models used by each provider
+# (may be replaced at startup by the model catalog, see catalog.py)
+PROVIDER_MODELS = {
+    "gemini": os.getenv("GEMINI_MODEL", "gemini-2.5-flash"),
+    "openrouter": os.getenv("OPENROUTER_MODEL", "qwen/qwen3-vl-30b-a3b-thinking"),
+    # "openrouter": "nvidia/nemotron-nano-12b-v2-vl:free",
+    "groq": os.getenv("GROQ_MODEL", "llama-3.2-11b-vision-preview"),
+    # Local model served in-process by hf_inference.py
+    "hf": os.getenv("HF_MODEL_ID", "llava-hf/llava-1.5-7b-hf"),
+}
+
+# Ask providers for schema-constrained JSON (Gemini responseSchema /
+# OpenAI-style json_schema); Groq's vision model does not support it
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "true").lower() in ("1", "true", "yes")
+
+# Upstream call / connection pool tuning
+PROVIDER_TIMEOUT_SECONDS = float(os.getenv("PROVIDER_TIMEOUT_SECONDS", "60"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx when installed)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+# -----------------------------
+# Shared HTTP Client
+# -----------------------------
+_http_client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled client, creating it on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(PROVIDER_TIMEOUT_SECONDS, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# -----------------------------
+# Key-Pooled POST
+# -----------------------------
+async def post_with_key_pool(pool, build_request, stream=False):
+    """POST with the key that has the most capacity left. A 429 cools that
+    key down for as long as the provider asks and retries at once on the
+    next key. Raises when no key is usable, so the chain can fall back.
+
+    build_request is a coroutine taking the API key and returning
+    (url, headers, payload), since the payload may reference per-key state.
+
+    With stream=True the body is left unread and the caller must aclose()
+    the response.
+    """
+    if not len(pool):
+        raise RuntimeError(f"No {pool.name} API key configured")
+
+    client = get_http_client()
+    for _ in range(len(pool)):
+        key = pool.acquire()
+        if key is None:
+            break
+
+        url, headers, payload = await build_request(key.value)
+        request = client.build_request("POST", url, headers=headers, json=payload)
+        response = await client.send(request, stream=stream)
+        if stream and response.status_code >= 400:
+            await response.aread()
+            await response.aclose()
+
+        if response.status_code == 429:
+            wait = retry_after_seconds(response)
+            log_event("key_rate_limited", provider=pool.name, key=f"...{key.value[-4:]}", retry_after=wait)
+            pool.cool_down(key, wait)
+            continue
+        if response.status_code in (401, 403):
+            log_event("key_rejected", provider=pool.name, key=f"...{key.value[-4:]}", status=response.status_code)
+            pool.cool_down(key, KEY_REJECTED_COOLDOWN_SECONDS)
+            continue
+
+        response.raise_for_status()
+        return response
+
+    raise RuntimeError(f"All {pool.name} API keys are rate limited or exhausted")
+
+
+# -----------------------------
+# Gemini Request
+# -----------------------------
+def gemini_generation_config():
+    config = {"responseMimeType": "application/json"}
+    if STRUCTURED_OUTPUT:
+        config["responseSchema"] = GEMINI_RESPONSE_SCHEMA
+    return config
+
+
+async def _gemini_post(images, prompt, method, stream=False):
+    """POST to a Gemini model method with the static prompt served from
+    its context cache when possible, otherwise inline ahead of the images
+    so implicit prefix caching can still reuse it.
+
+    If a cached handle is rejected (expired or deleted upstream) it is
+    dropped and the request is retried once with the prompt inline.
+    """
+    image_parts = [image.gemini_part() for image in images]
+    attempt = {"use_cache": True, "api_key": None, "cached": None}
+
+    # REST rather than the SDK: the SDK binds one global key and hides
+    # the rate-limit headers the key pool needs
+    async def build_request(api_key):
+        url = f"{GEMINI_BASE_URL}/models/{PROVIDER_MODELS['gemini']}:{method}"
+        headers = {"x-goog-api-key": api_key, "Content-Type": "application/json"}
+        payload = {"generationConfig": gemini_generation_config()}
+
+        cached = None
+        if attempt["use_cache"]:
+            cached = await gemini_context_cache.handle(
+                get_http_client(), GEMINI_BASE_URL, api_key, PROVIDER_MODELS["gemini"], prompt
+            )
+        attempt.update(api_key=api_key, cached=cached)
+
+        if cached:
+            PROMPT_CACHE_STATS["gemini_cached_requests"] += 1
+            payload["cachedContent"] = cached
+            payload["contents"] = [{"role": "user", "parts": image_parts}]
+        else:
+            payload["contents"] = [{"role": "user", "parts": [{"text": prompt.text}] + image_parts}]
+        return url, headers, payload
+
+    try:
+        return await post_with_key_pool(KEY_POOLS["gemini"], build_request, stream=stream)
+    except httpx.HTTPStatusError as e:
+        if not attempt["cached"] or e.response.status_code not in (400, 404):
+            raise
+        log_event("gemini_cache_rejected", fallback="inline prompt")
+        gemini_context_cache.invalidate(attempt["api_key"], PROVIDER_MODELS["gemini"], prompt)
+        PROMPT_CACHE_STATS["gemini_fallbacks"] += 1
+        attempt["use_cache"] = False
+        return await post_with_key_pool(KEY_POOLS["gemini"], build_request, stream=stream)
+
+
+# -----------------------------
+# Gemini Call
+# -----------------------------
+async def call_gemini(images, prompt):
+    try:
+        response = await _gemini_post(images, prompt, "generateContent")
+
+        data = response.json()
+        record_cached_tokens(data.get("usageMetadata", {}).get("cachedContentTokenCount"))
+        text = "".join(part.get("text", "") for part in data["candidates"][0]["content"]["parts"])
+
+        return extract_json(text, "gemini")
+    except Exception as e:
+        log_event("provider_error", provider="gemini", error=str(e))
+        return None
+
+
+# -----------------------------
+# Gemini Streaming Call
+# -----------------------------
+async def _iter_sse_data(response):
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            yield line[len("data:"):].strip()
+
+
+async def stream_gemini(images, prompt):
+    """Yield response text chunks from streamGenerateContent (SSE)."""
+    log_event("provider_stream", provider="gemini")
+
+    response = await _gemini_post(images, prompt, "streamGenerateContent?alt=sse", stream=True)
+    try:
+        async for data in _iter_sse_data(response):
+            candidates = json.loads(data).get("candidates") or [{}]
+            for part in candidates[0].get("content", {}).get("parts", []):
+                if part.get("text"):
+                    yield part["text"]
+    finally:
+        await response.aclose()
+
+
+# -----------------------------
+# OpenAI-compatible Chat Completions Call
+# -----------------------------
+def prompt_text_part(prompt, cache_prompt):
+    # The static instructions go first so provider prefix caches can reuse them
+    part = {"type": "text", "text": prompt.text}
+    if cache_prompt:
+        part["cache_control"] = {"type": "ephemeral"}
+    return part
+
+
+async def _call_chat_completions(url, pool, model, images, prompt, structured, cache_prompt):
+    content = [prompt_text_part(prompt, cache_prompt)]
+    content += [image.openai_part() for image in images]
+
+    payload = {
+        "model": model,
+        "messages": [
+            {
+                "role": "user",
+                "content": content
+            }
+        ]
+    }
+    if structured:
+        payload["response_format"] = OPENAI_RESPONSE_FORMAT
+
+    async def build_request(api_key):
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        return url, headers, payload
+
+    response = await post_with_key_pool(pool, build_request)
+
+    data = response.json()
+    cached_tokens = (data.get("usage") or {}).get("prompt_tokens_details", {}) or {}
+    record_cached_tokens(cached_tokens.get("cached_tokens"))
+    return data["choices"][0]["message"]["content"]
+
+
+async def _stream_chat_completions(url, pool, model, images, prompt, structured, cache_prompt):
+    content = [prompt_text_part(prompt, cache_prompt)]
+    content += [image.openai_part() for image in images]
+
+    payload = {
+        "model": model,
+        "stream": True,
+        "messages": [
+            {
+                "role": "user",
+                "content": content
+            }
+        ]
+    }
+    if structured:
+        payload["response_format"] = OPENAI_RESPONSE_FORMAT
+
+    async def build_request(api_key):
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        return url, headers, payload
+
+    response = await post_with_key_pool(pool, build_request, stream=True)
+    try:
+        async for data in _iter_sse_data(response):
+            if data == "[DONE]":
+                break
+            choices = json.loads(data).get("choices") or [{}]
+            text = choices[0].get("delta", {}).get("content")
+            if text:
+                yield text
+    finally:
+        await response.aclose()
+
+
+# -----------------------------
+# OpenRouter Call
+# -----------------------------
+async def call_openrouter(images, prompt):
+    try:
+        text = await _call_chat_completions(
+            f"{OPENROUTER_BASE_URL}/chat/completions",
+            KEY_POOLS["openrouter"],
+            PROVIDER_MODELS["openrouter"],
+            images,
+            prompt,
+            STRUCTURED_OUTPUT,
+            OPENROUTER_PROMPT_CACHE,
+        )
+
+        return extract_json(text, "openrouter")
+    except Exception as e:
+        log_event("provider_error", provider="openrouter", error=str(e))
+        return None
+
+
+# -----------------------------
+# Groq Call
+# -----------------------------
+async def call_groq(images, prompt):
+    try:
+        text = await _call_chat_completions(
+            f"{GROQ_BASE_URL}/chat/completions",
+            KEY_POOLS["groq"],
+            PROVIDER_MODELS["groq"],
+            images,
+            prompt,
+            False,
+            False,
+        )
+
+        return extract_json(text, "groq")
+    except Exception as e:
+        log_event("provider_error", provider="groq", error=str(e))
+        return None
+
+
+# -----------------------------
+# Streaming Variants
+# -----------------------------
+def stream_openrouter(images, prompt):
+    log_event("provider_stream", provider="openrouter")
+    return _stream_chat_completions(
+        f"{OPENROUTER_BASE_URL}/chat/completions",
+        KEY_POOLS["openrouter"],
+        PROVIDER_MODELS["openrouter"],
+        images,
+        prompt,
+        STRUCTURED_OUTPUT,
+        OPENROUTER_PROMPT_CACHE,
+    )
+
+
+def stream_groq(images, prompt):
+    log_event("provider_stream", provider="groq")
+    return _stream_chat_completions(
+        f"{GROQ_BASE_URL}/chat/completions",
+        KEY_POOLS["groq"],
+        PROVIDER_MODELS["groq"],
+        images,
+        prompt,
+        False,
+        False,
+    )
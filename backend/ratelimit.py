@@ -0,0 +1,109 @@
+import asyncio
+import os
+import time
+
+from metrics import log_event
+
+# Longest a request will wait for provider budget before skipping that provider
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "30"))
+
+
+# -----------------------------
+# Async Token Bucket
+# -----------------------------
+class TokenBucket:
+    """Requests-per-minute budget with a small burst allowance.
+    A rate of 0 means unlimited."""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or max(1, rate_per_minute // 10))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self):
+        if self.rate <= 0:
+            return None
+        self._refill()
+        return self.tokens
+
+    def try_acquire(self):
+        """Take one token only if it is available right now."""
+        if self.rate <= 0:
+            return True
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def acquire(self, max_wait=None):
+        """Take one token, sleeping until it is available. Returns False
+        instead of waiting longer than max_wait.
+
+        Tokens are reserved up front (the balance may go negative), so
+        concurrent callers queue behind each other in arrival order.
+        """
+        if self.rate <= 0:
+            return True
+
+        self._refill()
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return True
+
+        wait = -self.tokens / self.rate
+        if max_wait is not None and wait > max_wait:
+            self.tokens += 1
+            return False
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            self.tokens += 1
+            raise
+        return True
+
+
+# -----------------------------
+# Per-Provider Budgets
+# -----------------------------
+def _provider_rpm(name):
+    return int(os.getenv(f"PROVIDER_RPM_{name.upper()}", "0"))
+
+
+_buckets = {}
+
+
+def get_bucket(name):
+    if name not in _buckets:
+        _buckets[name] = TokenBucket(_provider_rpm(name))
+    return _buckets[name]
+
+
+def rate_limited(name, call):
+    """Wrap a provider call so it first takes a token from that provider's
+    PROVIDER_RPM_<NAME> budget. When the budget is exhausted for longer
+    than RATE_LIMIT_MAX_WAIT_SECONDS the provider is skipped (None), the
+    same as a failed call, so the chain moves on."""
+    async def limited(images, prompt):
+        if not await get_bucket(name).acquire(RATE_LIMIT_MAX_WAIT_SECONDS):
+            log_event("provider_skipped", provider=name, reason="request budget exhausted")
+            return None
+        return await call(images, prompt)
+
+    return limited
+
+
+def budget_snapshot():
+    return {
+        name: {
+            "requests_per_minute": bucket.rate * 60 or None,
+            "tokens_available": bucket.available(),
+        }
+        for name, bucket in _buckets.items()
+    }
@@ -0,0 +1,131 @@
+import asyncio
+import importlib
+import inspect
+import sys
+import time
+
+from metrics import log_event
+
+
+# -----------------------------
+# Provider Registry
+# -----------------------------
+class ProviderSpec:
+    """Where a provider's functions live. The module is imported the
+    first time the provider is called (or, with a startup hook, in the
+    background at startup), so a deployment only pays for the SDKs
+    (torch/transformers for the local model) of the providers in its
+    PROVIDER_CHAIN."""
+
+    def __init__(self, name, module, call, stream=None, startup=None, shutdown=None):
+        self.name = name
+        self.module = module
+        self.call = call
+        self.stream = stream
+        self.startup = startup
+        self.shutdown = shutdown
+        self.loaded = None
+        self.import_seconds = None
+
+    def load(self):
+        """Import the module (once) and return it. Safe to call from
+        several threads; the import lock serializes them."""
+        if self.loaded is None:
+            already_imported = self.module in sys.modules
+            started = time.perf_counter()
+            module = importlib.import_module(self.module)
+            self.import_seconds = 0.0 if already_imported else round(time.perf_counter() - started, 3)
+            self.loaded = module
+            log_event("provider_loaded", provider=self.name, module=self.module, import_seconds=self.import_seconds)
+        return self.loaded
+
+    async def _module(self):
+        # First use imports off the event loop; torch alone takes seconds
+        return self.loaded or await asyncio.to_thread(self.load)
+
+
+PROVIDERS = {
+    "gemini": ProviderSpec("gemini", "providers", "call_gemini", "stream_gemini"),
+    "openrouter": ProviderSpec("openrouter", "providers", "call_openrouter", "stream_openrouter"),
+    "groq": ProviderSpec("groq", "providers", "call_groq", "stream_groq"),
+    "hf": ProviderSpec("hf", "hf_inference", "call_local", startup="start", shutdown="shutdown"),
+}
+
+
+def check_chain(chain):
+    """Fail at startup, not on the first request, on a misspelled provider."""
+    unknown = [name for name in chain if name not in PROVIDERS]
+    if unknown:
+        raise ValueError(f"Unknown provider(s) in PROVIDER_CHAIN: {', '.join(unknown)} (known: {', '.join(PROVIDERS)})")
+    return chain
+
+
+def provider_call(name):
+    """Like the providers.call_* functions, never raises: a failed import
+    (e.g. torch missing) or any error inside the call logs and returns
+    None, so the chain moves on to the next provider."""
+    spec = PROVIDERS[name]
+
+    async def call(images, prompt):
+        try:
+            module = await spec._module()
+            return await getattr(module, spec.call)(images, prompt)
+        except Exception as e:
+            log_event("provider_error", provider=name, error=str(e))
+            return None
+
+    return call
+
+
+def provider_stream(name):
+    """Async-generator counterpart of provider_call, or None when the
+    provider cannot stream."""
+    spec = PROVIDERS[name]
+    if spec.stream is None:
+        return None
+
+    async def stream(images, prompt):
+        module = await spec._module()
+        async for chunk in getattr(module, spec.stream)(images, prompt):
+            yield chunk
+
+    return stream
+
+
+async def start_providers(chain):
+    """For enabled providers with a startup hook (the local model), import
+    the module off the event loop and run the hook, so slow loads begin at
+    startup instead of on the first request. Meant to run as a background
+    task from the app lifespan; failures are logged, not raised."""
+    for name in chain:
+        spec = PROVIDERS[name]
+        if spec.startup is None:
+            continue
+        try:
+            module = await spec._module()
+            getattr(module, spec.startup)()
+        except Exception as e:
+            log_event("provider_start_failed", provider=name, error=str(e))
+
+
+async def shutdown_providers():
+    """Run the shutdown hook of every provider that was actually loaded."""
+    for spec in PROVIDERS.values():
+        if spec.loaded is None or spec.shutdown is None:
+            continue
+        result = getattr(spec.loaded, spec.shutdown)()
+        if inspect.isawaitable(result):
+            await result
+
+
+def registry_snapshot(chain):
+    return {
+        name: {
+            "enabled": name in chain,
+            "module": spec.module,
+            "loaded": spec.loaded is not None,
+            "import_seconds": spec.import_seconds,
+            "streams": spec.stream is not None,
+        }
+        for name, spec in PROVIDERS.items()
+    }
@@ -0,0 +1,264 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+
+# Rolling statistics
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", "0.3"))
+ROUTER_LATENCY_SAMPLES = int(os.getenv("ROUTER_LATENCY_SAMPLES", "100"))
+ROUTER_ERROR_WINDOW_SECONDS = float(os.getenv("ROUTER_ERROR_WINDOW_SECONDS", "60"))
+# Share of requests that try an unmeasured or stale provider first, so a
+# slow-but-working leader cannot keep the others from ever being measured
+ROUTER_EXPLORE_RATE = float(os.getenv("ROUTER_EXPLORE_RATE", "0.05"))
+# A latency estimate older than this is due for a fresh sample
+ROUTER_STALE_SECONDS = float(os.getenv("ROUTER_STALE_SECONDS", "300"))
+
+# Circuit breaker
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "4"))
+BREAKER_CONSECUTIVE_FAILURES = int(os.getenv("BREAKER_CONSECUTIVE_FAILURES", "3"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+# -----------------------------
+# Per-Provider Statistics
+# -----------------------------
+class ProviderStats:
+    def __init__(self):
+        self.ewma_latency = None
+        self.latencies = deque(maxlen=ROUTER_LATENCY_SAMPLES)
+        self.outcomes = deque()  # (timestamp, succeeded)
+        self.consecutive_failures = 0
+        self.successes = 0
+        self.failures = 0
+        self.measured_at = None  # monotonic time of the last latency sample
+        self.explorations = 0
+
+    def is_stale(self):
+        return self.measured_at is None or time.monotonic() - self.measured_at > ROUTER_STALE_SECONDS
+
+    def _trim(self, now):
+        while self.outcomes and self.outcomes[0][0] < now - ROUTER_ERROR_WINDOW_SECONDS:
+            self.outcomes.popleft()
+
+    def record(self, succeeded, latency):
+        now = time.monotonic()
+        self.outcomes.append((now, succeeded))
+        self._trim(now)
+
+        if succeeded:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.latencies.append(latency)
+            self.measured_at = now
+            if self.ewma_latency is None:
+                self.ewma_latency = latency
+            else:
+                self.ewma_latency += ROUTER_EWMA_ALPHA * (latency - self.ewma_latency)
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+
+    def record_censored(self, elapsed):
+        """A call cancelled after `elapsed` seconds (a hedged loser) would
+        have taken at least that long. The lower bound only ever raises the
+        estimate, so a provider that keeps losing hedges drifts down the
+        order even though it never completes."""
+        self.measured_at = time.monotonic()
+        if self.ewma_latency is None:
+            self.ewma_latency = elapsed
+        elif elapsed > self.ewma_latency:
+            self.ewma_latency += ROUTER_EWMA_ALPHA * (elapsed - self.ewma_latency)
+
+    def window(self):
+        self._trim(time.monotonic())
+        calls = len(self.outcomes)
+        errors = sum(1 for _, succeeded in self.outcomes if not succeeded)
+        return calls, errors
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# -----------------------------
+# Circuit Breaker
+# -----------------------------
+class CircuitBreaker:
+    """closed -> open on a high windowed error rate or a run of failures,
+    open -> half_open after BREAKER_OPEN_SECONDS, where a single probe
+    call decides whether to close again or re-open."""
+
+    def __init__(self):
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def current_state(self):
+        if self.state == OPEN and time.monotonic() - self.opened_at >= BREAKER_OPEN_SECONDS:
+            self.state = HALF_OPEN
+            self.probe_in_flight = False
+        return self.state
+
+    def allows_call(self):
+        state = self.current_state()
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self.probe_in_flight:
+            return True
+        return False
+
+    def on_start(self):
+        if self.current_state() == HALF_OPEN:
+            self.probe_in_flight = True
+
+    def on_result(self, succeeded, stats):
+        if self.state == HALF_OPEN:
+            self.probe_in_flight = False
+            if succeeded:
+                self.state = CLOSED
+            else:
+                self._trip()
+            return
+
+        if succeeded:
+            return
+        calls, errors = stats.window()
+        if stats.consecutive_failures >= BREAKER_CONSECUTIVE_FAILURES or (
+            calls >= BREAKER_MIN_CALLS and errors / calls >= BREAKER_ERROR_RATE
+        ):
+            self._trip()
+
+    def on_cancel(self):
+        self.probe_in_flight = False
+
+    def _trip(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+
+# -----------------------------
+# Adaptive Provider Router
+# -----------------------------
+class ProviderRouter:
+    def __init__(self):
+        self.stats = {}
+        self.breakers = {}
+
+    def _get(self, name):
+        if name not in self.stats:
+            self.stats[name] = ProviderStats()
+            self.breakers[name] = CircuitBreaker()
+        return self.stats[name], self.breakers[name]
+
+    def order(self, providers):
+        """Reorder (name, call) pairs: healthy providers by EWMA latency
+        (untried ones keep their configured position), then half-open
+        probes, and open breakers only when nothing else is left."""
+        healthy, probing, tripped = [], [], []
+        for position, (name, call) in enumerate(providers):
+            stats, breaker = self._get(name)
+            state = breaker.current_state()
+            if state == CLOSED:
+                healthy.append((position, name, call))
+            elif breaker.allows_call():
+                probing.append((name, call))
+            else:
+                tripped.append((name, call))
+
+        known = sorted(
+            (entry for entry in healthy if self.stats[entry[1]].ewma_latency is not None),
+            key=lambda entry: self.stats[entry[1]].ewma_latency,
+        )
+        # Untried providers stay in their configured slots, measured ones fill the rest fastest-first
+        ordered = []
+        known_iter = iter(known)
+        for entry in healthy:
+            if self.stats[entry[1]].ewma_latency is None:
+                ordered.append(entry)
+            else:
+                ordered.append(next(known_iter))
+
+        # Exploration: now and then lead with the healthy provider whose
+        # estimate is missing or oldest, so rankings follow real latency
+        explorable = [entry for entry in ordered[1:] if self.stats[entry[1]].is_stale()]
+        if explorable and random.random() < ROUTER_EXPLORE_RATE:
+            pick = min(explorable, key=lambda entry: self.stats[entry[1]].measured_at or 0.0)
+            ordered.remove(pick)
+            ordered.insert(0, pick)
+            self.stats[pick[1]].explorations += 1
+
+        ranked = [(name, call) for _, name, call in ordered] + probing
+        return ranked or tripped
+
+    def begin(self, name):
+        """Mark a call as started. Returns False, without starting it, when
+        the breaker is half-open and another request already holds the
+        probe: the order was computed earlier, so it is re-checked here."""
+        breaker = self._get(name)[1]
+        if breaker.current_state() == HALF_OPEN and breaker.probe_in_flight:
+            return False
+        breaker.on_start()
+        return True
+
+    def finish(self, name, succeeded, latency):
+        stats, breaker = self._get(name)
+        stats.record(succeeded, latency)
+        breaker.on_result(succeeded, stats)
+
+    def abandon(self, name, elapsed=None):
+        # A hedged loser was cancelled: that says nothing about its health,
+        # but its elapsed time is a lower bound on its latency
+        stats, breaker = self._get(name)
+        breaker.on_cancel()
+        if elapsed is not None:
+            stats.record_censored(elapsed)
+
+    def wrap(self, name, call):
+        async def routed(images, prompt):
+            if not self.begin(name):
+                return None
+            started = time.perf_counter()
+            try:
+                result = await call(images, prompt)
+            except asyncio.CancelledError:
+                self.abandon(name, time.perf_counter() - started)
+                raise
+            except Exception:
+                result = None
+            self.finish(name, bool(result), time.perf_counter() - started)
+            return result
+
+        return routed
+
+    def route(self, providers):
+        return [(name, self.wrap(name, call)) for name, call in self.order(providers)]
+
+    def snapshot(self):
+        state = {}
+        for name, stats in self.stats.items():
+            calls, errors = stats.window()
+            state[name] = {
+                "breaker": self.breakers[name].current_state(),
+                "ewma_latency_seconds": stats.ewma_latency,
+                "p50_latency_seconds": stats.percentile(0.5),
+                "p95_latency_seconds": stats.percentile(0.95),
+                "window_calls": calls,
+                "window_errors": errors,
+                "window_error_rate": errors / calls if calls else 0.0,
+                "consecutive_failures": stats.consecutive_failures,
+                "successes": stats.successes,
+                "failures": stats.failures,
+                "explorations": stats.explorations,
+            }
+        return state
+
+
+provider_router = ProviderRouter()
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import time
+
+from dispatch import get_stream_chain
+from metrics import log_event, provider_attempt, PROVIDER_FAILOVERS
+from parsing import extract_json
+from ratelimit import get_bucket, RATE_LIMIT_MAX_WAIT_SECONDS
+from router import provider_router
+
+
+# -----------------------------
+# Incremental Category Parser
+# -----------------------------
+class CategoryStreamParser:
+    """Scan model output as it arrives and return every
+    {"category": ..., "conditions": [...]} object the moment its closing
+    brace is seen, whether the categories sit in a top-level array or in
+    an array inside a wrapper object."""
+
+    def __init__(self):
+        self.text = ""
+        self.position = 0
+        self.stack = []  # (bracket, start offset)
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, chunk):
+        self.text += chunk
+        text = self.text
+
+        completed = []
+        for index in range(self.position, len(text)):
+            char = text[index]
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+
+            if char == '"' and self.stack:
+                self.in_string = True
+            elif char in "{[":
+                self.stack.append((char, index))
+            elif char in "}]" and self.stack:
+                bracket, start = self.stack.pop()
+                if char == "}" and bracket == "{" and self.stack and self.stack[-1][0] == "[":
+                    category = self._category(text[start:index + 1])
+                    if category is not None:
+                        completed.append(category)
+
+        self.position = len(text)
+        return completed
+
+    @staticmethod
+    def _category(fragment):
+        if '"category"' not in fragment:
+            return None
+        try:
+            value = json.loads(fragment)
+        except ValueError:
+            return None
+        if isinstance(value, dict) and "category" in value and "conditions" in value:
+            return value
+        return None
+
+
+# -----------------------------
+# Streaming Provider Chain
+# -----------------------------
+async def stream_provider_chain(images, prompt):
+    """Stream from providers in router order, yielding (event, data):
+
+    - ("category", {...}) for each category as soon as it closes
+    - ("reset", {"provider": name}) when a provider dies after emitting
+      categories, before the next provider starts over
+    - ("result", {"provider": name, "result": ...}) once the full text parses
+
+    The full text goes through the same extract_json as the non-streaming
+    path, so the final result is identical.
+    """
+    chain = get_stream_chain()
+    for name, stream in chain:
+        if not await get_bucket(name).acquire(RATE_LIMIT_MAX_WAIT_SECONDS):
+            log_event("provider_skipped", provider=name, reason="request budget exhausted")
+            continue
+
+        if not provider_router.begin(name):
+            log_event("provider_skipped", provider=name, reason="breaker probe in flight", stream=True)
+            continue
+
+        parser = CategoryStreamParser()
+        emitted = 0
+        started = time.perf_counter()
+        # Same attempt metrics and logs as dispatch.instrument_provider
+        with provider_attempt(name, stream=True) as attempt:
+            try:
+                async for chunk in stream(images, prompt):
+                    for category in parser.feed(chunk):
+                        emitted += 1
+                        yield "category", category
+                result = extract_json(parser.text, name)
+            except (GeneratorExit, asyncio.CancelledError):
+                provider_router.abandon(name, time.perf_counter() - started)
+                raise
+            except Exception as e:
+                log_event("provider_error", provider=name, error=str(e), stream=True)
+                result = None
+            if result:
+                attempt["outcome"] = "success"
+
+        provider_router.finish(name, bool(result), time.perf_counter() - started)
+        if result:
+            if name != chain[0][0]:
+                PROVIDER_FAILOVERS.inc(from_provider=chain[0][0], to_provider=name)
+            yield "result", {"provider": name, "result": result}
+            return
+        if emitted:
+            yield "reset", {"provider": name}